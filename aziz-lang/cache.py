@@ -0,0 +1,85 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+# content-addressed on-disk cache for pipeline artifacts.
+#
+#   <root>/<key[:2]>/<key>.<stage>
+#
+# the key hashes everything a stage's artifact depends on: the source, the compiler itself (its passes and xdsl version)
+# and the external tools the stage runs. entries are touched on every hit and evicted least-recently-used first.
+
+CACHE_DIR = Path(os.environ.get("AZIZ_CACHE_DIR", Path.home() / ".cache" / "aziz"))
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class ArtifactCache:
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def key(self, src: str | bytes, tools: tuple[str, ...] = ()) -> str:
+        return _sha256(src.encode() if isinstance(src, str) else src, compiler_fingerprint().encode(), tool_fingerprint(tools).encode())
+
+    def get(self, key: str, stage: str) -> bytes | None:
+        path = self._path(key, stage)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # mark as recently used
+        return data
+
+    def put(self, key: str, stage: str, data: bytes) -> None:
+        path = self._path(key, stage)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write-then-rename, so concurrent readers never see a partial artifact
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def evict(self) -> None:
+        # drop least recently used artifacts until the cache fits into `max_bytes`
+        entries = [(p.stat(), p) for p in self.root.glob("*/*") if p.is_file()]
+        total = sum(st.st_size for st, _ in entries)
+        for st, path in sorted(entries, key=lambda e: e[0].st_mtime_ns):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+
+    def _path(self, key: str, stage: str) -> Path:
+        return self.root / key[:2] / f"{key}.{stage}"
+
+
+@lru_cache(None)
+def compiler_fingerprint() -> str:
+    # any change to the passes, dialect or frontend invalidates all entries
+    import xdsl
+
+    sources = sorted(Path(__file__).parent.rglob("*.py"))
+    return _sha256(str(xdsl.__version__).encode(), *(p.read_bytes() for p in sources))
+
+
+@lru_cache(None)
+def tool_fingerprint(tools: tuple[str, ...]) -> str:
+    # path, size and mtime of each binary: cheap to compute and changes with every upgrade
+    parts = []
+    for tool in tools:
+        path = shutil.which(tool)
+        st = os.stat(path) if path else None
+        parts.append(f"{tool}:{path}:{st.st_size if st else 0}:{st.st_mtime_ns if st else 0}".encode())
+    return _sha256(*parts)
+
+
+def _sha256(*parts: bytes) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
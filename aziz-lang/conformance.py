@@ -0,0 +1,168 @@
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from difflib import unified_diff
+from pathlib import Path
+
+from pipeline import Pipeline, context
+
+# differential conformance and performance harness: every source file of a corpus is compiled and run by all three
+# backends, their outputs are diffed and their compile / run times end up in one report.
+#
+#   python conformance.py ../examples [--runs 3] [--save report.json] [--baseline report.json]
+#
+# exits non-zero if backends diverge (or the arena and builder asts of a file do), a backend fails or (with --baseline) a timing regresses.
+
+# backend -> (last compile stage, output stage). the frontend (`module_op`) is timed separately, it is shared.
+BACKENDS: dict[str, tuple[str, str]] = {
+    "interpreter": ("module_op", "interpreter_output"),
+    "llvm": ("llvm_exe", "llvm_output"),
+    "riscv": ("riscv_elf", "emulator_output"),
+}
+
+# the interpreter prints python floats (`2.25`), the compiled backends printf's `%f` (`2.250000`)
+FLOAT = re.compile(r"-?\d+\.\d+")
+
+
+@dataclass(slots=True)
+class BackendResult:
+    file: str
+    backend: str
+    frontend: list[float]  # seconds, one sample per run
+    compile: list[float]
+    run: list[float]
+    output: str | None = None
+    error: str | None = None
+
+
+def normalize(output: str) -> str:
+    return FLOAT.sub(lambda m: f"{float(m.group()):.6f}", output)
+
+
+def run_backend(file: Path, backend: str, runs: int = 1) -> BackendResult:
+    # fresh pipeline per run, so every sample includes the whole compilation
+    compile_stage, output_stage = BACKENDS[backend]
+    result = BackendResult(str(file), backend, [], [], [])
+    try:
+        for _ in range(runs):
+            pipeline = Pipeline(file)
+            start = time.perf_counter()
+            pipeline.module_op
+            frontend = time.perf_counter()
+            getattr(pipeline, compile_stage)
+            compiled = time.perf_counter()
+            result.output = getattr(pipeline, output_stage)
+            result.frontend.append(frontend - start)
+            result.compile.append(compiled - frontend)
+            result.run.append(time.perf_counter() - compiled)
+    except Exception:
+        result.error = traceback.format_exc().strip().splitlines()[-1]
+    return result
+
+
+def run_corpus(files: list[Path], backends: list[str], runs: int = 1, jobs: int | None = None) -> list[BackendResult]:
+    # one job per (file, backend), results in corpus order
+    jobs_args = [(file, backend, runs) for file in files for backend in backends]
+    with ProcessPoolExecutor(jobs, initializer=context) as pool:
+        return list(pool.map(run_backend, *zip(*jobs_args)))
+
+
+def divergences(results: list[BackendResult]) -> list[str]:
+    # unified diffs of every backend output that differs from the first backend's, per file
+    diffs = []
+    by_file: dict[str, list[BackendResult]] = {}
+    for r in results:
+        by_file.setdefault(r.file, []).append(r)
+    for file, rs in by_file.items():
+        ok = [r for r in rs if r.error is None]
+        if not ok:
+            continue
+        ref = ok[0]
+        for r in ok[1:]:
+            if normalize(r.output) != normalize(ref.output):
+                diff = unified_diff(normalize(ref.output).splitlines(), normalize(r.output).splitlines(), f"{file} ({ref.backend})", f"{file} ({r.backend})", lineterm="")
+                diffs.append("\n".join(diff))
+    return diffs
+
+
+def ast_mismatches(files: list[Path]) -> list[str]:
+    # the pipeline parses into the ast arena, which interns literals; its ast must dump exactly like the plain builder's
+    from frontend.ast_nodes import dump
+    from frontend.parser import AzizParser
+
+    found = []
+    for file in files:
+        src = file.read_text()
+        try:
+            arena, builder = dump(AzizParser(file, src, arena=True).parse_module()), dump(AzizParser(file, src).parse_module())
+        except Exception:
+            continue  # parse errors show up as failed runs
+        if arena != builder:
+            diff = unified_diff(builder.splitlines(), arena.splitlines(), f"{file} (ast builder)", f"{file} (ast arena)", lineterm="")
+            found.append("\n".join(diff))
+    return found
+
+
+def regressions(results: list[BackendResult], baseline: dict, tolerance: float) -> list[str]:
+    # (file, backend, phase) medians that got slower than `tolerance` times the baseline median
+    found = []
+    for r in results:
+        old = baseline.get(f"{r.file}:{r.backend}")
+        if r.error is not None or old is None:
+            continue
+        for phase in ("frontend", "compile", "run"):
+            new_median, old_median = statistics.median(getattr(r, phase)), old[phase]
+            if old_median > 0 and new_median > old_median * tolerance:
+                found.append(f"{r.file} ({r.backend}) {phase}: {old_median * 1e3:.2f} ms -> {new_median * 1e3:.2f} ms")
+    return found
+
+
+def report(results: list[BackendResult]) -> str:
+    ms = lambda samples: f"{statistics.median(samples) * 1e3:.2f}" if samples else "-"
+    rows = [("file", "backend", "frontend ms", "compile ms", "run ms", "status")]
+    rows += [(r.file, r.backend, ms(r.frontend), ms(r.compile), ms(r.run), "ok" if r.error is None else r.error) for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(5)]
+    return "\n".join(row[0].ljust(widths[0]) + f"  {row[1].ljust(widths[1])}" + "".join(f"  {cell.rjust(w)}" for cell, w in zip(row[2:5], widths[2:])) + f"  {row[5]}" for row in rows)
+
+
+def main():
+    from main import collect_sources
+
+    parser = argparse.ArgumentParser(description="aziz differential conformance and performance harness")
+    parser.add_argument("files", nargs="+", help="source files or directories of source files")
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS), help="backends to compare (default: all)")
+    parser.add_argument("--runs", type=int, default=1, help="timed runs per file and backend, the report shows medians")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--save", type=Path, help="write per-file medians as json, to be used as a later --baseline")
+    parser.add_argument("--baseline", type=Path, help="fail if a median got slower than --tolerance times this baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor against --baseline")
+    args = parser.parse_args()
+
+    files = collect_sources(args.files)
+    results = run_corpus(files, args.backend or list(BACKENDS), args.runs, args.jobs)
+    print(report(results))
+
+    failed = [r for r in results if r.error is not None]
+    diffs = ast_mismatches(files) + divergences(results)
+    slow = regressions(results, json.loads(args.baseline.read_text()), args.tolerance) if args.baseline else []
+    for diff in diffs:
+        print(f"\n{diff}")
+    if slow:
+        print("\nregressions:\n" + "\n".join(slow))
+    print(f"\n{len(results)} runs, {len(failed)} failed, {len(diffs)} divergent, {len(slow)} regressed")
+
+    if args.save:
+        medians = {f"{r.file}:{r.backend}": {phase: statistics.median(getattr(r, phase)) for phase in ("frontend", "compile", "run")} for r in results if r.error is None}
+        args.save.write_text(json.dumps(medians, indent=2))
+
+    sys.exit(1 if failed or diffs or slow else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,42 @@ from collections.abc import Sequence
 from typing import cast
 
 from xdsl.dialects.builtin import AnyFloat, FloatAttr, FunctionType, IntegerAttr, IntegerType, StringAttr, SymbolNameConstraint, SymbolRefAttr, f64, i32
-from xdsl.ir import Attribute, Block, Dialect, ParametrizedAttribute, Region, SSAValue
+from xdsl.ir import Attribute, Block, Dialect, ParametrizedAttribute, Region, SSAValue, TypeAttribute
 from xdsl.irdl import AnyOf, IRDLOperation, attr_def, irdl_attr_definition, irdl_op_definition, operand_def, opt_attr_def, opt_operand_def, region_def, result_def, traits_def, var_operand_def, var_result_def
-from xdsl.traits import CallableOpInterface, HasParent, IsTerminator, Pure, SymbolOpInterface
+from xdsl.pattern_rewriter import RewritePattern
+from xdsl.traits import CallableOpInterface, HasCanonicalizationPatternsTrait, HasParent, IsolatedFromAbove, IsTerminator, Pure, SymbolOpInterface
 from xdsl.utils.exceptions import VerifyException
 
 
 @irdl_attr_definition
-class StringType(ParametrizedAttribute):
+class StringType(ParametrizedAttribute, TypeAttribute):
     name = "aziz.string"
 
 
+class ArithmeticCanonicalizationPatterns(HasCanonicalizationPatternsTrait):
+    @classmethod
+    def get_canonicalization_patterns(cls) -> tuple[RewritePattern, ...]:
+        from rewrites.canonicalize import ConstantsToTheRight, FoldConstantOperands, ReassociateConstants, SimplifyIdentities
+
+        return (FoldConstantOperands(), ConstantsToTheRight(), SimplifyIdentities(), ReassociateConstants())
+
+
+class CastCanonicalizationPatterns(HasCanonicalizationPatternsTrait):
+    @classmethod
+    def get_canonicalization_patterns(cls) -> tuple[RewritePattern, ...]:
+        from rewrites.canonicalize import FoldConstantCast
+
+        return (FoldConstantCast(),)
+
+
+class IfCanonicalizationPatterns(HasCanonicalizationPatternsTrait):
+    @classmethod
+    def get_canonicalization_patterns(cls) -> tuple[RewritePattern, ...]:
+        from rewrites.canonicalize import FoldConstantCondition
+
+        return (FoldConstantCondition(),)
+
+
 @irdl_op_definition
 class ConstantOp(IRDLOperation):
     name, traits = "aziz.constant", traits_def(Pure())
@@ -38,7 +63,7 @@ class StringConstantOp(IRDLOperation):
 
 @irdl_op_definition
 class AddOp(IRDLOperation):
-    name, traits = "aziz.add", traits_def(Pure())
+    name, traits = "aziz.add", traits_def(Pure(), ArithmeticCanonicalizationPatterns())
     lhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     rhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     res = result_def(AnyOf([IntegerType, AnyFloat]))
@@ -53,7 +78,7 @@ class AddOp(IRDLOperation):
 
 @irdl_op_definition
 class SubOp(IRDLOperation):
-    name, traits = "aziz.sub", traits_def(Pure())
+    name, traits = "aziz.sub", traits_def(Pure(), ArithmeticCanonicalizationPatterns())
     lhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     rhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     res = result_def(AnyOf([IntegerType, AnyFloat]))
@@ -68,7 +93,7 @@ class SubOp(IRDLOperation):
 
 @irdl_op_definition
 class MulOp(IRDLOperation):
-    name, traits = "aziz.mul", traits_def(Pure())
+    name, traits = "aziz.mul", traits_def(Pure(), ArithmeticCanonicalizationPatterns())
     lhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     rhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     res = result_def(AnyOf([IntegerType, AnyFloat]))
@@ -83,7 +108,7 @@ class MulOp(IRDLOperation):
 
 @irdl_op_definition
 class LessThanEqualOp(IRDLOperation):
-    name, traits = "aziz.le", traits_def(Pure())
+    name, traits = "aziz.le", traits_def(Pure(), ArithmeticCanonicalizationPatterns())
     lhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     rhs = operand_def(AnyOf([IntegerType, AnyFloat]))
     res = result_def(IntegerType)
@@ -194,29 +219,32 @@ class CallOp(IRDLOperation):
 @irdl_op_definition
 class YieldOp(IRDLOperation):
     name = "aziz.yield"
-    input = operand_def(AnyOf([IntegerType, AnyFloat, StringType]))
+    inputs = var_operand_def(AnyOf([IntegerType, AnyFloat, StringType]))
     traits = traits_def(IsTerminator())
 
-    def __init__(self, input: SSAValue):
-        super().__init__(operands=[input])
+    def __init__(self, *inputs: SSAValue):
+        super().__init__(operands=[inputs])
 
 
 @irdl_op_definition
 class IfOp(IRDLOperation):
-    name = "aziz.if"
+    # one result from IRGen, several once tail calls are eliminated (see `LoopOp`)
+    name, traits = "aziz.if", traits_def(IfCanonicalizationPatterns())
     cond = operand_def(IntegerType)
-    res = result_def(AnyOf([IntegerType, AnyFloat, StringType]))
+    res = var_result_def(AnyOf([IntegerType, AnyFloat, StringType]))
     then_region, else_region = region_def(), region_def()
 
     def __init__(
         self,
         cond: SSAValue,
-        result_type: Attribute = i32,
+        result_types: Attribute | Sequence[Attribute] = i32,
         regions: list[Region] | None = None,
     ):
         if regions is None:
             regions = [Region(Block()), Region(Block())]
-        super().__init__(operands=[cond], result_types=[result_type], regions=regions)
+        if isinstance(result_types, Attribute):
+            result_types = [result_types]
+        super().__init__(operands=[cond], result_types=[result_types], regions=regions)
 
     def verify_(self) -> None:
         then_block = self.then_region.block
@@ -232,13 +260,52 @@ class IfOp(IRDLOperation):
             raise VerifyException("expected last op of then region to be a YieldOp")
         if not isinstance(else_yield, YieldOp):
             raise VerifyException("expected last op of else region to be a YieldOp")
-        if then_yield.input.type != else_yield.input.type:
-            raise VerifyException(f"if expression branches have different types: {then_yield.input.type} vs {else_yield.input.type}")
+        if tuple(then_yield.inputs.types) != tuple(else_yield.inputs.types):
+            raise VerifyException(f"if expression branches have different types: {then_yield.inputs.types} vs {else_yield.inputs.types}")
+        if tuple(then_yield.inputs.types) != tuple(self.res.types):
+            raise VerifyException(f"if expression branches yield {then_yield.inputs.types} but it has results {self.res.types}")
+
+
+@irdl_op_definition
+class LoopOp(IRDLOperation):
+    # a self tail recursive function, turned into a loop. the body runs with `inits` as its arguments and ends with a
+    # `LoopConditionOp`: while its condition is nonzero, the body runs again with its first values as the arguments,
+    # then the loop results in the remaining values. the body only uses its arguments. lowers to scf.while
+    name = "aziz.loop"
+    traits = traits_def(IsolatedFromAbove())
+    inits = var_operand_def(AnyOf([IntegerType, AnyFloat, StringType]))
+    res = var_result_def(AnyOf([IntegerType, AnyFloat, StringType]))
+    body = region_def("single_block")
+
+    def __init__(self, inits: Sequence[SSAValue], result_types: Sequence[Attribute], body: Region):
+        super().__init__(operands=[inits], result_types=[result_types], regions=[body])
+
+    def verify_(self) -> None:
+        block = self.body.block
+        if tuple(block.arg_types) != tuple(self.inits.types):
+            raise VerifyException(f"expected loop body arguments {self.inits.types}, got {block.arg_types}")
+
+        condition = block.last_op
+        if not isinstance(condition, LoopConditionOp):
+            raise VerifyException("expected last op of LoopOp to be a LoopConditionOp")
+        if tuple(condition.values.types) != (*self.inits.types, *self.res.types):
+            raise VerifyException(f"expected loop condition values {(*self.inits.types, *self.res.types)}, got {condition.values.types}")
+
+
+@irdl_op_definition
+class LoopConditionOp(IRDLOperation):
+    name = "aziz.loop_condition"
+    cond = operand_def(IntegerType)
+    values = var_operand_def(AnyOf([IntegerType, AnyFloat, StringType]))
+    traits = traits_def(IsTerminator(), HasParent(LoopOp))
+
+    def __init__(self, cond: SSAValue, values: Sequence[SSAValue]):
+        super().__init__(operands=[cond, values])
 
 
 @irdl_op_definition
 class CastIntToFloatOp(IRDLOperation):
-    name, traits = "aziz.cast_int_to_float", traits_def(Pure())
+    name, traits = "aziz.cast_int_to_float", traits_def(Pure(), CastCanonicalizationPatterns())
     input = operand_def(IntegerType)
     res = result_def(AnyFloat)
 
@@ -261,6 +328,8 @@ Aziz = Dialect(
         CallOp,
         YieldOp,
         IfOp,
+        LoopOp,
+        LoopConditionOp,
         CastIntToFloatOp,
     ],
     [StringType],
@@ -0,0 +1,133 @@
+from array import array
+
+from .ast_nodes import BinaryExprAST, CallExprAST, ExprAST, FunctionAST, IfExprAST, LineIndex, ModuleAST, NumberExprAST, PrintExprAST, PrototypeAST, SourceLoc, StringExprAST, VariableExprAST
+
+# the ast in parallel arrays instead of one object per node, for large programs. node i is
+#
+#   kinds[i]      what it is (NUMBER, ..., FUNCTION)
+#   offsets[i]    its source offset
+#   values[i]     index into `pool` of its literal, name, operator, callee or (function name, argument names)
+#   children[firsts[i] : firsts[i + 1]]    its operands, call arguments or function body
+#
+# nodes are added bottom-up by the parser (children before their parent), so the children ranges follow each other.
+# equal pool entries are stored once.
+#
+# IRGen, `dump` and everything else that reads the ast get views: instances of subclasses of the `ast_nodes` classes
+# that read their fields out of the arena when accessed. views are cheap and made on the fly, only the arrays persist.
+
+NUMBER, STRING, VARIABLE, BINARY, CALL, PRINT, IF, FUNCTION = range(8)
+
+
+class AstArena:
+    def __init__(self, lines: LineIndex):
+        self.lines = lines
+        self.kinds = bytearray()
+        self.offsets = array("I")
+        self.values = array("I")
+        self.firsts = array("I")
+        self.children = array("I")
+        self.pool: list = []
+        self._interned: dict = {}  # (type, entry) -> pool index, while building
+
+    def __getstate__(self) -> dict:
+        return {k: v for k, v in self.__dict__.items() if k != "_interned"}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state, _interned={})
+
+    # building, with the methods of `AstBuilder`. nodes are their indices
+
+    def number(self, offset: int, val: int | float) -> int:
+        return self._add(NUMBER, offset, val, ())
+
+    def string(self, offset: int, val: str | bytes) -> int:
+        return self._add(STRING, offset, val, ())
+
+    def variable(self, offset: int, name: str) -> int:
+        return self._add(VARIABLE, offset, name, ())
+
+    def binary(self, offset: int, op: str, lhs: int, rhs: int) -> int:
+        return self._add(BINARY, offset, op, (lhs, rhs))
+
+    def call(self, offset: int, callee: str, args: list[int]) -> int:
+        return self._add(CALL, offset, callee, args)
+
+    def print(self, offset: int, arg: int) -> int:
+        return self._add(PRINT, offset, None, (arg,))
+
+    def if_(self, offset: int, cond: int, then_expr: int, else_expr: int) -> int:
+        return self._add(IF, offset, None, (cond, then_expr, else_expr))
+
+    def function(self, offset: int, name: str, args: list[str], body: list[int]) -> int:
+        return self._add(FUNCTION, offset, (name, tuple(args)), body)
+
+    def module(self, ops: list[int]) -> ModuleAST:
+        return ModuleAST(tuple(view(self, i) for i in ops))
+
+    def _add(self, kind: int, offset: int, value: object, children) -> int:
+        # 1 and 1.0 are different literals, and so are 0.0 and -0.0 (equal and same hash), so floats go by bit pattern
+        key = (float, value.hex()) if isinstance(value, float) else (type(value), value)
+        if (entry := self._interned.get(key)) is None:
+            entry = self._interned[key] = len(self.pool)
+            self.pool.append(value)
+        self.kinds.append(kind)
+        self.offsets.append(offset)
+        self.values.append(entry)
+        self.firsts.append(len(self.children))
+        self.children.extend(children)
+        return len(self.kinds) - 1
+
+    # reading
+
+    def value(self, i: int):
+        return self.pool[self.values[i]]
+
+    def child(self, i: int, k: int) -> ExprAST:
+        return view(self, self.children[self.firsts[i] + k])
+
+    def child_views(self, i: int) -> list[ExprAST]:
+        end = self.firsts[i + 1] if i + 1 < len(self.firsts) else len(self.children)
+        return [view(self, c) for c in self.children[self.firsts[i] : end]]
+
+
+def view(arena: AstArena, i: int) -> ExprAST | FunctionAST:
+    return VIEWS[arena.kinds[i]](arena, i)
+
+
+def _view_class(base: type, **fields) -> type:
+    # `base` with its fields read from the arena, by getters of (arena, index). same name, so `dump` prints it alike
+    def __init__(self, arena: AstArena, index: int):
+        self.arena = arena
+        self.index = index
+
+    namespace = {
+        "__slots__": ("arena", "index"),
+        "__init__": __init__,
+        "__reduce__": lambda self: (view, (self.arena, self.index)),  # pickles the arena once, not the fields
+        "loc": property(lambda self: SourceLoc(self.arena.lines, self.arena.offsets[self.index])),
+        **{name: property(lambda self, get=get: get(self.arena, self.index)) for name, get in fields.items()},
+    }
+    return type(base.__name__, (base,), namespace)
+
+
+def _string(arena: AstArena, i: int) -> str:
+    val = arena.value(i)
+    return val.decode() if isinstance(val, bytes) else val
+
+
+def _prototype(arena: AstArena, i: int) -> PrototypeAST:
+    name, args = arena.value(i)
+    return PrototypeAST(SourceLoc(arena.lines, arena.offsets[i]), name, list(args))
+
+
+# kind -> view class
+VIEWS: tuple[type, ...] = (
+    _view_class(NumberExprAST, val=AstArena.value),
+    _view_class(StringExprAST, _val=_string, val=_string),
+    _view_class(VariableExprAST, name=AstArena.value),
+    _view_class(BinaryExprAST, op=AstArena.value, lhs=lambda a, i: a.child(i, 0), rhs=lambda a, i: a.child(i, 1)),
+    _view_class(CallExprAST, callee=AstArena.value, args=AstArena.child_views),
+    _view_class(PrintExprAST, arg=lambda a, i: a.child(i, 0)),
+    _view_class(IfExprAST, cond=lambda a, i: a.child(i, 0), then_expr=lambda a, i: a.child(i, 1), else_expr=lambda a, i: a.child(i, 2)),
+    _view_class(FunctionAST, proto=_prototype, body=lambda a, i: tuple(a.child_views(i))),
+)
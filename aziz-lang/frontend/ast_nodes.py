@@ -1,11 +1,41 @@
+import re
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
 
 from xdsl.utils.lexer import Location
 
 
+class LineIndex:
+    # offsets of all line starts of a source, to resolve offsets to lines and columns by bisection
+    def __init__(self, file: str, content: str | bytes):
+        newline = "\n" if isinstance(content, str) else b"\n"
+        self.file = file
+        self.starts = array("I", [0])
+        self.starts.extend(m.end() for m in re.finditer(newline, content))
+
+    def location(self, offset: int) -> Location:
+        line = bisect_right(self.starts, offset)
+        return Location(self.file, line, offset - self.starts[line - 1] + 1)
+
+
+@dataclass(slots=True)
+class SourceLoc:
+    # source offset of a node, only resolved to a `Location` when printed (locations are for diagnostics)
+    lines: LineIndex
+    offset: int
+
+    @property
+    def location(self) -> Location:
+        return self.lines.location(self.offset)
+
+    def __str__(self) -> str:
+        return str(self.location)
+
+
 @dataclass(slots=True)
 class ExprAST:
-    loc: Location
+    loc: SourceLoc
 
 
 @dataclass(slots=True)
@@ -20,7 +50,13 @@ class VariableExprAST(ExprAST):
 
 @dataclass(slots=True)
 class StringExprAST(ExprAST):
-    val: str
+    _val: str | bytes  # utf-8 of a mapped source until first used
+
+    @property
+    def val(self) -> str:
+        if isinstance(self._val, bytes):
+            self._val = self._val.decode()
+        return self._val
 
 
 @dataclass(slots=True)
@@ -50,14 +86,14 @@ class IfExprAST(ExprAST):
 
 @dataclass(slots=True)
 class PrototypeAST:  # function's signature without body
-    loc: Location
+    loc: SourceLoc
     name: str
     args: list[str]
 
 
 @dataclass(slots=True)
 class FunctionAST:
-    loc: Location
+    loc: SourceLoc
     proto: PrototypeAST
     body: tuple[ExprAST, ...]
 
@@ -67,16 +103,75 @@ class ModuleAST:
     ops: tuple[FunctionAST | ExprAST, ...]
 
 
-def dump(node: object, indent: int = 0) -> str:
-    if not isinstance(node, (ExprAST, PrototypeAST, FunctionAST, ModuleAST)):
-        return repr(node)
+class AstBuilder:
+    # what the parser builds the ast with: out of node objects. `AstArena` builds the same tree into arrays instead
+    def __init__(self, lines: LineIndex):
+        self.lines = lines
 
-    ind = "  " * indent
+    def number(self, offset: int, val: int | float) -> NumberExprAST:
+        return NumberExprAST(SourceLoc(self.lines, offset), val)
 
-    def fmt(v):
-        if isinstance(v, list | tuple):
-            return f"[\n{ind}    " + f",\n{ind}    ".join(dump(x, indent + 2) for x in v) + f"\n{ind}  ]" if v else "[]"
-        return dump(v, indent + 1)
+    def string(self, offset: int, val: str | bytes) -> StringExprAST:
+        return StringExprAST(SourceLoc(self.lines, offset), val)
 
-    fields = (f"{k}={fmt(getattr(node, k))}" for k in node.__dataclass_fields__ if k != "loc")
-    return f"{type(node).__name__}(\n{ind}  " + f",\n{ind}  ".join(fields) + f"\n{ind})"
+    def variable(self, offset: int, name: str) -> VariableExprAST:
+        return VariableExprAST(SourceLoc(self.lines, offset), name)
+
+    def binary(self, offset: int, op: str, lhs: ExprAST, rhs: ExprAST) -> BinaryExprAST:
+        return BinaryExprAST(SourceLoc(self.lines, offset), op, lhs, rhs)
+
+    def call(self, offset: int, callee: str, args: list[ExprAST]) -> CallExprAST:
+        return CallExprAST(SourceLoc(self.lines, offset), callee, args)
+
+    def print(self, offset: int, arg: ExprAST) -> PrintExprAST:
+        return PrintExprAST(SourceLoc(self.lines, offset), arg)
+
+    def if_(self, offset: int, cond: ExprAST, then_expr: ExprAST, else_expr: ExprAST) -> IfExprAST:
+        return IfExprAST(SourceLoc(self.lines, offset), cond, then_expr, else_expr)
+
+    def function(self, offset: int, name: str, args: list[str], body: list[ExprAST]) -> FunctionAST:
+        loc = SourceLoc(self.lines, offset)
+        return FunctionAST(loc, PrototypeAST(loc, name, args), tuple(body))
+
+    def module(self, ops: list[FunctionAST | ExprAST]) -> ModuleAST:
+        return ModuleAST(tuple(ops))
+
+
+def dump(node: object, indent: int = 0) -> str:
+    # iterative, deeply nested programs would exceed the recursion limit. `stack` holds text and (node, indent) pairs
+    out: list[str] = []
+    stack: list[str | tuple[object, int]] = [(node, indent)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            out.append(item)
+            continue
+
+        node, indent = item
+        if not isinstance(node, (ExprAST, PrototypeAST, FunctionAST, ModuleAST)):
+            out.append(repr(node))
+            continue
+
+        ind = "  " * indent
+        parts: list[str | tuple[object, int]] = [f"{type(node).__name__}(\n{ind}  "]
+        names = [k.lstrip("_") for k in node.__dataclass_fields__ if k != "loc"]  # private fields through their property
+        for i, k in enumerate(names):
+            v = getattr(node, k)
+            if i:
+                parts.append(f",\n{ind}  ")
+            parts.append(f"{k}=")
+            if isinstance(v, list | tuple):
+                if not v:
+                    parts.append("[]")
+                    continue
+                parts.append(f"[\n{ind}    ")
+                for j, x in enumerate(v):
+                    if j:
+                        parts.append(f",\n{ind}    ")
+                    parts.append((x, indent + 2))
+                parts.append(f"\n{ind}  ]")
+            else:
+                parts.append((v, indent + 1))
+        parts.append(f"\n{ind})")
+        stack.extend(reversed(parts))
+    return "".join(out)
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Iterable
 
 from dialects.aziz import AddOp, CallOp, CastIntToFloatOp, ConstantOp, FuncOp, IfOp, LessThanEqualOp, MulOp, PrintOp, ReturnOp, StringConstantOp, StringType, SubOp, YieldOp
+from symbols import SymbolIndex
 from xdsl.builder import Builder, InsertPoint
 from xdsl.dialects.builtin import FunctionType, ModuleOp, f64, i32
 from xdsl.ir import Attribute, Block, Region, SSAValue
@@ -13,29 +16,101 @@ class IRGenError(Exception):
     pass
 
 
+def function_asts(module_ast: ModuleAST) -> list[FunctionAST]:
+    # functions in declaration order, top-level expressions become the body of an implicit main function
+    functions = [op for op in module_ast.ops if isinstance(op, FunctionAST)]
+    main_body = [op for op in module_ast.ops if isinstance(op, ExprAST)]
+    return _with_main(functions, main_body)
+
+
+def _with_main(functions: list[FunctionAST], main_body: list[ExprAST]) -> list[FunctionAST]:
+    if main_body:
+        loc = main_body[0].loc
+        main_func = FunctionAST(loc, PrototypeAST(loc, "main", []), tuple(main_body))
+        functions.append(main_func)
+    return functions
+
+
+def collect_call_signatures(exprs: Iterable[ExprAST], signatures: dict[str, list[Attribute]]) -> None:
+    # merges the argument types of the calls in `exprs` whose arguments are all literals into `signatures`, function
+    # name -> argument types. calls are merged in source order.
+    stack = list(exprs)[::-1]
+
+    # pre-order walk with an explicit stack, children pushed in reverse so calls are seen in source order
+    while stack:
+        match node := stack.pop():
+            case CallExprAST():
+                arg_types = [_literal_type(arg) for arg in node.args]
+                if None not in arg_types:
+                    _merge_signature(signatures, node.callee, arg_types)
+                stack.extend(reversed(node.args))
+            case BinaryExprAST():
+                stack += [node.rhs, node.lhs]
+            case IfExprAST():
+                stack += [node.else_expr, node.then_expr, node.cond]
+            case PrintExprAST():
+                stack.append(node.arg)
+
+
+def declared_type(proto: PrototypeAST, inferred_types: dict[str, list[Attribute]]) -> FunctionType:
+    # argument types are i32 by default unless inferred otherwise
+    arg_count = len(proto.args)
+    arg_types = inferred_types.get(proto.name, [i32] * arg_count)
+    if len(arg_types) != arg_count:
+        arg_types = [i32] * arg_count
+
+    # return type (just a single i32 for now)
+    return_types = [i32]
+
+    return FunctionType.from_lists(inputs=arg_types, outputs=return_types)
+
+
+def _merge_signature(signatures: dict[str, list[Attribute]], name: str, sig: list[Attribute]) -> None:
+    final_sig = signatures.get(name)
+    if final_sig is None:
+        signatures[name] = sig
+        return
+
+    if len(sig) != len(final_sig):
+        raise IRGenError(f"function '{name}' called with inconsistent arity. {len(final_sig)} vs {len(sig)}")
+
+    for i, (t1, t2) in enumerate(zip(final_sig, sig)):
+        if t1 == t2:
+            continue
+
+        if {t1, t2} == {i32, f64}:
+            final_sig[i] = f64  # promote
+        else:
+            raise IRGenError(f"function '{name}' called with inconsistent types at arg {i}. can't reconcile {t1} and {t2}.")
+
+
+def _literal_type(node: ExprAST) -> Attribute | None:
+    match node:
+        case StringExprAST():
+            return StringType()
+        case NumberExprAST(val=float()):
+            return f64
+        case NumberExprAST(val=int()):
+            return i32
+        case _:
+            return None
+
+
 @dataclass(init=False)
 class IRGen:
     module: ModuleOp
     builder: Builder  # to insert ops into the current block
     symbol_table: ScopedDict[str, SSAValue] | None = None  # var name -> SSAValue in current scope (drops on exit)
 
-    def __init__(self):
+    def __init__(self, external: dict[str, FunctionType] | None = None):
         self.module = ModuleOp([])
         self.builder = Builder(InsertPoint.at_end(self.module.body.blocks[0]))
+        self.symbols = SymbolIndex.of(self.module)  # shared with the passes over this module
+        self.external = external if external is not None else {}  # name -> type of callable functions not in this module
 
     def ir_gen_module(self, module_ast: ModuleAST) -> ModuleOp:
-        functions = [op for op in module_ast.ops if isinstance(op, FunctionAST)]
-
-        # implicit main function
-        main_body = [op for op in module_ast.ops if isinstance(op, ExprAST)]
-        if main_body:
-            loc = main_body[0].loc
-            main_func = FunctionAST(loc, PrototypeAST(loc, "main", []), tuple(main_body))
-            functions.append(main_func)
-
-        # first pass: collect call signatures and declare functions
-        signatures = self._collect_call_signatures(module_ast)
-        inferred_types = self._resolve_signatures(signatures)
+        # one pass over the ast finds the functions and infers their argument types, then they are declared in order
+        functions, inferred_types = self._collect_functions(module_ast)
         for func in functions:
             self._declare_function(func, inferred_types)
 
@@ -47,90 +122,45 @@ class IRGen:
         self.module.verify()
         return self.module
 
-    def _collect_call_signatures(self, module_ast: ModuleAST) -> dict[str, list[list[Attribute]]]:
-        # function name -> list of argument type lists, inferred from calls
-        signatures: dict[str, list[list[Attribute]]] = {}
-
-        def _type_of(node: ExprAST) -> Attribute | None:
-            match node:
-                case StringExprAST():
-                    return StringType()
-                case NumberExprAST(val=float()):
-                    return f64
-                case NumberExprAST(val=int()):
-                    return i32
-                case _:
-                    return None
-
-        def visit(node: object):
-            if isinstance(node, CallExprAST):
-                arg_types = [_type_of(arg) for arg in node.args]
-
-                if all(t is not None for t in arg_types):
-                    valid_types = [t for t in arg_types if t is not None]
-                    signatures.setdefault(node.callee, []).append(valid_types)  # update
-
-            if hasattr(node, "__dataclass_fields__"):
-                for field in node.__dataclass_fields__:
-                    visit(getattr(node, field))
-            elif isinstance(node, (list, tuple)):
-                for item in node:
-                    visit(item)
-
-        visit(module_ast)
-        return signatures
-
-    def _resolve_signatures(self, signatures: dict[str, list[list[Attribute]]]) -> dict[str, list[Attribute]]:
-        resolved: dict[str, list[Attribute]] = {}
-
-        for name, sigs in signatures.items():
-            if not sigs:
-                continue
-
-            final_sig = list(sigs[0])
-
-            for sig in sigs[1:]:
-                if len(sig) != len(final_sig):
-                    raise IRGenError(f"function '{name}' called with inconsistent arity. {len(final_sig)} vs {len(sig)}")
-
-                for i, (t1, t2) in enumerate(zip(final_sig, sig)):
-                    if t1 == t2:
-                        continue
-
-                    if {t1, t2} == {i32, f64}:
-                        final_sig[i] = f64  # promote
-                    else:
-                        raise IRGenError(f"function '{name}' called with inconsistent types at arg {i}. can't reconcile {t1} and {t2}.")
-
-            resolved[name] = final_sig
+    def ir_gen_function(self, func_ast: FunctionAST, inferred_types: dict[str, list[Attribute]]) -> FuncOp:
+        # a single function into this module, calling the functions of `external` (streaming, see `streaming`)
+        self._declare_function(func_ast, inferred_types)
+        self._ir_gen_function(func_ast)
+        func_op = self.symbols.lookup(func_ast.proto.name)
+        func_op.verify()
+        return func_op
+
+    def _collect_functions(self, module_ast: ModuleAST) -> tuple[list[FunctionAST], dict[str, list[Attribute]]]:
+        # functions as `function_asts` returns them, and function name -> argument types inferred from the calls whose
+        # arguments are all literals, in one pass over the ast
+        functions: list[FunctionAST] = []
+        main_body: list[ExprAST] = []
+        signatures: dict[str, list[Attribute]] = {}
+
+        for op in module_ast.ops:
+            if isinstance(op, FunctionAST):
+                functions.append(op)
+                collect_call_signatures(op.body, signatures)
+            else:
+                main_body.append(op)
+                collect_call_signatures((op,), signatures)
 
-        return resolved
+        return _with_main(functions, main_body), signatures
 
     def _declare_function(self, func_ast: FunctionAST, inferred_types: dict[str, list[Attribute]]) -> None:
         name = func_ast.proto.name
-        arg_names = func_ast.proto.args
-        arg_count = len(arg_names)
-
-        # argument types are i32 by default unless inferred otherwise
-        arg_types = inferred_types.get(name, [i32] * arg_count)
-        if len(arg_types) != arg_count:
-            arg_types = [i32] * arg_count
-
-        # return type (just a single i32 for now)
-        return_types = [i32]
-
-        func_type = FunctionType.from_lists(inputs=arg_types, outputs=return_types)
-        block = Block(arg_types=arg_types)
+        func_type = declared_type(func_ast.proto, inferred_types)
+        block = Block(arg_types=func_type.inputs.data)
         region = Region(block)
         is_private = name != "main"  # required for dead code elimination
         func_op = FuncOp(name, func_type, region, private=is_private)
-        self.builder.insert(func_op)
+        self.symbols.add(func_op)
 
     def _ir_gen_function(self, func_ast: FunctionAST) -> None:
         name = func_ast.proto.name
 
-        func_op = next((op for op in self.module.body.blocks[0].ops if isinstance(op, FuncOp) and op.sym_name.data == name), None)
-        if not func_op:
+        func_op = self.symbols.lookup(name)
+        if not isinstance(func_op, FuncOp):
             raise IRGenError(f"function {name} not declared")
 
         block = func_op.body.blocks[0]
@@ -172,77 +202,100 @@ class IRGen:
             self.builder = parent_builder
 
     def _ir_gen_expr(self, expr: ExprAST) -> SSAValue | None:
-        match expr:
-            case BinaryExprAST():
-                lhs, rhs = self._ir_gen_expr(expr.lhs), self._ir_gen_expr(expr.rhs)
-                ops = {"+": AddOp, "-": SubOp, "*": MulOp, "<=": LessThanEqualOp}
-                if cls := ops.get(expr.op):
-                    return self.builder.insert(cls(lhs, rhs)).res
-                raise IRGenError(f"unknown binary op {expr.op}")
+        # iterative, deeply nested expressions would exceed the recursion limit. `todo` holds expressions still to be
+        # generated and (step, n) continuations, which take the last n values off `values` and push their result.
+        todo: list[ExprAST | tuple[Callable, int]] = [expr]
+        values: list = []
+        while todo:
+            item = todo.pop()
+            if isinstance(item, tuple):
+                step, n = item
+                operands = values[len(values) - n :]
+                del values[len(values) - n :]
+                values.append(step(*operands))
+                continue
 
-            case NumberExprAST():
-                return self.builder.insert(ConstantOp(expr.val)).res
+            match item:
+                case BinaryExprAST():
+                    todo += [(partial(self._ir_gen_binary, item.op), 2), item.rhs, item.lhs]
 
-            case VariableExprAST():
-                if self.symbol_table is None or expr.name not in self.symbol_table:
-                    raise IRGenError(f"undefined var {expr.name}")
-                return self.symbol_table[expr.name]
+                case NumberExprAST():
+                    values.append(self.builder.insert(ConstantOp(item.val)).res)
 
-            case PrintExprAST():
-                val = self._ir_gen_expr(expr.arg)
-                self.builder.insert(PrintOp(val))
-                return None
+                case VariableExprAST():
+                    if self.symbol_table is None or item.name not in self.symbol_table:
+                        raise IRGenError(f"undefined var {item.name}")
+                    values.append(self.symbol_table[item.name])
 
-            case StringExprAST():
-                return self.builder.insert(StringConstantOp(expr.val)).res
+                case PrintExprAST():
+                    todo += [(self._ir_gen_print, 1), item.arg]
 
-            case IfExprAST():
-                return self._ir_gen_if(expr)
+                case StringExprAST():
+                    values.append(self.builder.insert(StringConstantOp(item.val)).res)
 
-            case CallExprAST():
-                return self._ir_gen_call(expr)
+                case IfExprAST():
+                    # cond, then the branches, each in its own block
+                    todo += [(self._ir_gen_if, 4), item.else_expr, (self._ir_gen_if_else, 1), item.then_expr, (self._ir_gen_if_then, 0), item.cond]
+
+                case CallExprAST():
+                    callee_type = self._check_call(item)
+                    todo += [(partial(self._ir_gen_call, item, callee_type), len(item.args)), *reversed(item.args)]
 
-            case _:
-                raise IRGenError(f"unknown expr type: {expr}")
+                case _:
+                    raise IRGenError(f"unknown expr type: {item}")
+
+        return values.pop()
 
-    def _ir_gen_if(self, expr: IfExprAST) -> SSAValue:
-        cond_val = self._ir_gen_expr(expr.cond)
+    def _ir_gen_binary(self, op: str, lhs: SSAValue, rhs: SSAValue) -> SSAValue:
+        ops = {"+": AddOp, "-": SubOp, "*": MulOp, "<=": LessThanEqualOp}
+        if cls := ops.get(op):
+            return self.builder.insert(cls(lhs, rhs)).res
+        raise IRGenError(f"unknown binary op {op}")
 
-        then_block = Block()
-        else_block = Block()
+    def _ir_gen_print(self, val: SSAValue) -> None:
+        self.builder.insert(PrintOp(val))
+        return None
 
+    def _ir_gen_if_then(self) -> Builder:
+        # returns the builder to restore after the else branch
         original_builder = self.builder
+        self.builder = Builder(InsertPoint.at_end(Block()))
+        return original_builder
 
-        self.builder = Builder(InsertPoint.at_end(then_block))
-        then_val = self._ir_gen_expr(expr.then_expr)
+    def _ir_gen_if_else(self, then_val: SSAValue) -> tuple[SSAValue, Block]:
         self.builder.insert(YieldOp(then_val))
+        then_block = self.builder.insertion_point.block
+        self.builder = Builder(InsertPoint.at_end(Block()))
+        return then_val, then_block
 
-        self.builder = Builder(InsertPoint.at_end(else_block))
-        else_val = self._ir_gen_expr(expr.else_expr)
+    def _ir_gen_if(self, cond_val: SSAValue, original_builder: Builder, then: tuple[SSAValue, Block], else_val: SSAValue) -> SSAValue:
         self.builder.insert(YieldOp(else_val))
-
+        else_block = self.builder.insertion_point.block
         self.builder = original_builder
 
+        then_val, then_block = then
         if_op = IfOp(cond_val, then_val.type, [Region(then_block), Region(else_block)])
-        return self.builder.insert(if_op).res
+        return self.builder.insert(if_op).res[0]
 
-    def _ir_gen_call(self, expr: CallExprAST) -> SSAValue:
-        callee_op = next((op for op in self.module.body.blocks[0].ops if isinstance(op, FuncOp) and op.sym_name.data == expr.callee), None)
+    def _check_call(self, expr: CallExprAST) -> FunctionType:
+        callee_op = self.symbols.lookup(expr.callee)
+        callee_type = callee_op.function_type if isinstance(callee_op, FuncOp) else self.external.get(expr.callee)
 
-        if not callee_op:
+        if callee_type is None:
             raise IRGenError(f"unknown function called: {expr.callee}")
 
-        expected_inputs = callee_op.function_type.inputs.data
+        expected_inputs = callee_type.inputs.data
         if len(expr.args) != len(expected_inputs):
             raise IRGenError(f"function {expr.callee} expects {len(expected_inputs)} args but got {len(expr.args)}")
+        return callee_type
 
-        args_values = [self._ir_gen_expr(arg) for arg in expr.args]
-        final_args = self._cast_call_arguments(expr.callee, args_values, expected_inputs)  # must match expected types
+    def _ir_gen_call(self, expr: CallExprAST, callee_type: FunctionType, *args_values: SSAValue) -> SSAValue:
+        final_args = self._cast_call_arguments(expr.callee, list(args_values), callee_type.inputs.data)  # must match expected types
 
-        if not callee_op.function_type.outputs.data:
+        if not callee_type.outputs.data:
             raise IRGenError(f"function {expr.callee} returns void but used as expression")
 
-        ret_type = callee_op.function_type.outputs.data[0]
+        ret_type = callee_type.outputs.data[0]
         call_op = CallOp(expr.callee, final_args, [ret_type])
         return self.builder.insert(call_op).res[0]
 
@@ -1,9 +1,14 @@
+import mmap
+import os
 import re
+from array import array
+from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import TypeAlias
+from pathlib import Path
+from typing import Iterator, TypeAlias
 
 from xdsl.utils.exceptions import ParseError
-from xdsl.utils.lexer import Lexer, Position, Span, Token
+from xdsl.utils.lexer import Input, Lexer, Span, Token
 
 
 class AzizTokenKind(Enum):
@@ -23,11 +28,6 @@ class AzizTokenKind(Enum):
     STRING = auto()
 
 
-SINGLE_CHAR_TOKENS = {
-    "(": AzizTokenKind.PAREN_OPEN,
-    ")": AzizTokenKind.PAREN_CLOSE,
-}
-
 KEYWORD_TOKENS = {
     "defun": AzizTokenKind.DEFUN,
     "print": AzizTokenKind.PRINT,
@@ -36,93 +36,133 @@ KEYWORD_TOKENS = {
 
 AzizToken: TypeAlias = Token[AzizTokenKind]
 
+IDENTIFIER_CHAR = r"[a-zA-Z0-9_+\-*/%<>=!?]"
+
+# kind -> pattern, tried in this order (a number wins over an identifier starting with a digit, a keyword over an
+# identifier). the last alternative catches unexpected characters and unterminated strings.
+TOKEN_PATTERNS: tuple[tuple[AzizTokenKind | None, str], ...] = (
+    (AzizTokenKind.STRING, r'"(?:[^"\\]|\\.)*"'),
+    (AzizTokenKind.NUMBER, r"-?\d+(?:\.\d+)?"),
+    (AzizTokenKind.PAREN_OPEN, r"\("),
+    (AzizTokenKind.PAREN_CLOSE, r"\)"),
+    *((kind, rf"{text}(?!{IDENTIFIER_CHAR})") for text, kind in KEYWORD_TOKENS.items()),
+    (AzizTokenKind.IDENTIFIER, rf"{IDENTIFIER_CHAR}+"),
+    (AzizTokenKind.EOF, r"\Z"),
+    (None, "."),
+)
+
+# one alternation for all tokens, so a source is classified in a single scan: each match skips the comments and
+# whitespace before a token, the number of the group that matched tells its kind.
+TOKEN_REGEX = re.compile(r"(?:;[^\n]*\n?|\s+)*(?:" + "|".join(f"({pattern})" for _, pattern in TOKEN_PATTERNS) + ")", re.ASCII | re.DOTALL)
+TOKEN_REGEX_BYTES = re.compile(TOKEN_REGEX.pattern.encode(), re.ASCII | re.DOTALL)  # for `MappedSource`, utf-8 passes through strings
+
+_EOF_GROUP, _ERROR_GROUP = len(TOKEN_PATTERNS) - 1, len(TOKEN_PATTERNS)
+_GROUP_KINDS = bytes([0, *(kind.value if kind else 0 for kind, _ in TOKEN_PATTERNS)]).ljust(256, b"\0")  # `bytearray.translate` table
+_KINDS = {kind.value: kind for kind in AzizTokenKind}
+
+
+@dataclass(slots=True)
+class TokenBuffer:
+    # all tokens of an input as parallel arrays, ending with EOF: kind values and [start, end) offsets (32 bit, sources
+    # are far below 4 GiB)
+    kinds: bytearray
+    starts: array
+    ends: array
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+
+def tokenize(input: Input) -> TokenBuffer:
+    groups, starts, ends = bytearray(), array("I"), array("I")
+    mapped = isinstance(input.content, MappedSource)
+    for match in (TOKEN_REGEX_BYTES.finditer(input.content.data) if mapped else TOKEN_REGEX.finditer(input.content)):
+        group = match.lastindex
+        groups.append(group)
+        starts.append(match.start(group))
+        ends.append(match.end())
+        if group >= _EOF_GROUP:  # `\Z` would match again at the end
+            break
+
+    if groups[-1] == _ERROR_GROUP:
+        start = starts[-1]
+        if input.content[start] == '"':
+            raise ParseError(Span(start, input.len, input), "unterminated string literal")
+        raise ParseError(Span(start, start + 1, input), f"unexpected character: {input.content[start]}")
+    return TokenBuffer(groups.translate(_GROUP_KINDS), starts, ends)
+
+
+def top_level_forms(data: bytes) -> Iterator[tuple[int, int]]:
+    # [start, end) of every top-level form (a list or an atom), one at a time instead of tokenizing the whole source.
+    # an unclosed list, a stray closing paren or an unlexable rest is yielded as a form of its own, for the parser to report
+    depth, start = 0, 0
+    for match in TOKEN_REGEX_BYTES.finditer(data):
+        group = match.lastindex
+        if group >= _EOF_GROUP:
+            if depth or group == _ERROR_GROUP:
+                yield (start if depth else match.start(group)), len(data)
+            return
+        if not depth:
+            start = match.start(group)
+        kind = _GROUP_KINDS[group]
+        depth += 1 if kind == AzizTokenKind.PAREN_OPEN.value else -1 if kind == AzizTokenKind.PAREN_CLOSE.value else 0
+        if depth <= 0:
+            depth = 0
+            yield start, match.end()
 
-class AzizLexer(Lexer[AzizTokenKind]):
-    def lex(self) -> AzizToken:  # entry point, implements abstract method from parent class
-        self._consume_whitespace()
 
-        start_pos = self.pos
-        current_char = self._peek_chars()
+class MappedSource:
+    # read-only source file through mmap, to be wrapped in an `Input` instead of the decoded text. it is str-like as far as
+    # `Input` and `Span` use it: slices are decoded on access and offsets are byte offsets. nothing may reference the
+    # source after `close()`, the parser copies what the ast keeps.
 
-        # end of file
-        if current_char is None:
-            return self._form_token(AzizTokenKind.EOF, start_pos)
+    def __init__(self, path: str | Path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""  # empty files can't be mapped
 
-        # string
-        if current_char == '"':
-            return self._lex_string(start_pos)
+    def __len__(self) -> int:
+        return len(self.data)
 
-        # number (digit or -digit)
-        if current_char.isdigit() or (current_char == "-" and self._peek_chars(2) and self._peek_chars(2)[1].isdigit()):
-            return self._lex_number(start_pos)
+    def __getitem__(self, key: int | slice) -> str:
+        return self.data[key : key + 1].decode(errors="replace") if isinstance(key, int) else self.data[key].decode(errors="replace")
 
-        # single char token
-        if current_char in SINGLE_CHAR_TOKENS:
-            self._consume_chars()
-            return self._form_token(SINGLE_CHAR_TOKENS[current_char], start_pos)
+    def find(self, sub: str, start: int = 0, end: int | None = None) -> int:
+        return self.data.find(sub.encode(), start, len(self.data) if end is None else end)
 
-        # identifiers
-        if current_char.isalnum() or current_char in "_+-*/%<>=!?":
-            return self._lex_identifier(start_pos)
+    def rfind(self, sub: str, start: int = 0, end: int | None = None) -> int:
+        return self.data.rfind(sub.encode(), start, len(self.data) if end is None else end)
 
-        raise ParseError(Span(start_pos, start_pos + 1, self.input), f"unexpected character: {current_char}")
+    def count(self, sub: str, start: int = 0, end: int | None = None) -> int:
+        return self.data[start:end].count(sub.encode())
 
-    def _consume_whitespace(self) -> None:
-        whitespace_regex = re.compile(r"((;[^\n]*(\n)?)|(\s+))*", re.ASCII)  # comment or whitespace
-        match = whitespace_regex.match(self.input.content, self.pos)
-        if match is None:
-            return
-        self.pos = match.end()
-
-    def _peek_chars(self, size: int = 1) -> str | None:
-        is_in_bounds = self.pos + size - 1 < self.input.len
-        if not is_in_bounds:
-            return None
-        return self.input.slice(self.pos, self.pos + size)
-
-    def _lex_string(self, start_pos: Position) -> AzizToken:
-        def get_chars(size: int = 1) -> str | None:
-            is_in_bounds = self.pos + size - 1 < self.input.len
-            if not is_in_bounds:
-                return None
-            res = self.input.slice(self.pos, self.pos + size)
-            self.pos += size
-            return res
-
-        self._consume_chars()  # consume opening quote
-
-        while True:
-            char = get_chars()
-            if char is None:
-                raise ParseError(Span(start_pos, self.pos, self.input), "unterminated string literal")
-
-            if char == '"':
-                break
-
-            if char == "\\":
-                self._consume_chars()  # skip escaped char
-
-        return self._form_token(AzizTokenKind.STRING, start_pos)
-
-    def _consume_chars(self, size: int = 1) -> None:
-        self.pos += size
-
-    def _lex_number(self, start_pos: Position) -> AzizToken:
-        number_regex = re.compile(r"-?\d+(\.\d+)?")
-        self._consume_regex(number_regex)
-        return self._form_token(AzizTokenKind.NUMBER, start_pos)
-
-    def _lex_identifier(self, start_pos: Position) -> AzizToken:
-        identifier_regex = re.compile(r"[a-zA-Z0-9_+\-*/%<>=!?]+")
-        self._consume_regex(identifier_regex)
-
-        span = Span(start_pos, self.pos, self.input)
-        kind = KEYWORD_TOKENS.get(span.text, AzizTokenKind.IDENTIFIER)
-        return Token(kind, span)
-
-    def _consume_regex(self, regex: re.Pattern[str]) -> re.Match[str] | None:
-        match = regex.match(self.input.content, self.pos)
-        if match is None:
-            return None
-        self.pos = match.end()
-        return match
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self) -> "MappedSource":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # parse errors print their context lazily, so they are moved to the decoded text before the mapping goes away
+        if isinstance(exc, ParseError) and exc.span.input.content is self:
+            char_offset = lambda pos: len(self.data[:pos].decode(errors="replace"))
+            exc.span = Span(char_offset(exc.span.start), char_offset(exc.span.end), Input(self.data[:].decode(errors="replace"), exc.span.input.name))
+        self.close()
+
+
+@dataclass
+class AzizLexer(Lexer[AzizTokenKind]):
+    # the input is tokenized up front, `lex` hands out the buffered tokens
+    tokens: TokenBuffer = field(init=False)
+    index: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        self.tokens = tokenize(self.input)
+
+    def lex(self) -> AzizToken:  # entry point, implements abstract method from parent class
+        i = self.index
+        if i < len(self.tokens) - 1:  # EOF repeats
+            self.index += 1
+        self.pos = self.tokens.ends[i]
+        return Token(_KINDS[self.tokens.kinds[i]], Span(self.tokens.starts[i], self.pos, self.input))
@@ -0,0 +1,90 @@
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from pathlib import Path
+
+from xdsl.utils.exceptions import ParseError
+from xdsl.utils.lexer import Input, Span
+
+from .ast_arena import AstArena, view
+from .ast_nodes import LineIndex, ModuleAST
+from .parser import AzizParser
+
+# parsing a large source on several cores. top-level forms are independent, so the source is split after top-level
+# closing parens into chunks that are parsed into arenas by a process pool, one module is assembled from their views.
+#
+#   source ─> split at depth 0 ─> chunk arenas (workers, offsets rebased to the whole source) ─> ModuleAST, in order
+#
+# a parse error is reported for the first failing chunk, with its position in the whole source.
+
+# sources below this many characters are parsed sequentially, a pool costs more than it saves
+PARALLEL_PARSE_CHARS = 256 * 1024
+MIN_CHUNK_CHARS = 64 * 1024
+
+# strings and comments are blanked out before parens are counted, so the parens in them don't count. the same rules as
+# the lexer's: whichever of them starts first extends over the other's delimiters
+STRING_OR_COMMENT = re.compile(r'"(?:[^"\\]|\\.)*"|;[^\n]*')
+PAREN = re.compile(r"[()]")
+
+
+def split_top_level(src: str, n: int) -> list[int]:
+    # up to `n - 1` offsets splitting `src` into about equally large runs of whole top-level forms: the end of the first
+    # top-level form that ends after each of the targets. depth is counted in bulk up to a target, paren by paren after
+    code = STRING_OR_COMMENT.sub(lambda m: " " * len(m.group()), src)  # same offsets
+    bounds: list[int] = []
+    pos, depth = 0, 0
+    for k in range(1, n):
+        target = len(code) * k // n
+        if target > pos:
+            depth += code.count("(", pos, target) - code.count(")", pos, target)
+            pos = target
+        for match in PAREN.finditer(code, pos):
+            depth += 1 if match.group() == "(" else -1
+            if depth == 0 and match.group() == ")":
+                pos = match.end()
+                break
+        else:
+            break  # no more top-level forms (or unbalanced parens, left to the parser to report)
+        bounds.append(pos)
+    return bounds
+
+
+def parse_parallel(file: Path, src: str, jobs: int) -> ModuleAST:
+    n = max(1, min(4 * jobs, len(src) // MIN_CHUNK_CHARS))  # a few chunks per worker, to even out their sizes
+    bounds = [0, *split_top_level(src, n), len(src)]
+    starts, ends = bounds[:-1], bounds[1:]
+
+    with ProcessPoolExecutor(min(jobs, len(starts))) as pool:
+        results = list(pool.map(_parse_chunk, repeat(str(file)), (src[a:b] for a, b in zip(starts, ends)), starts))
+
+    lines = LineIndex(str(file), src)
+    ops = []
+    for result in results:
+        if isinstance(result, tuple):
+            start, end, msg = result
+            raise ParseError(Span(start, end, Input(src, str(file))), msg)
+        result.arena.lines = lines
+        ops += (view(result.arena, i) for i in result.tops)
+    return ModuleAST(tuple(ops))
+
+
+@dataclass(slots=True)
+class _Chunk:
+    # a parsed chunk: its arena and the nodes of its top-level forms
+    arena: AstArena
+    tops: array
+
+
+def _parse_chunk(file: str, text: str, base: int) -> _Chunk | tuple[int, int, str]:
+    # process pool entry point. parse errors come back as (start, end, message) in the whole source
+    try:
+        parser = AzizParser(Path(file), text, arena=True)  # tokenizes
+        module_ast = parser.parse_module()
+    except ParseError as e:
+        return e.span.start + base, e.span.end + base, e.msg
+    arena = parser.nodes
+    arena.offsets = array("I", (offset + base for offset in arena.offsets))
+    arena.lines = None  # of the chunk, replaced by the whole source's
+    return _Chunk(arena, array("I", (op.index for op in module_ast.ops)))
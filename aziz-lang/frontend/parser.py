@@ -1,14 +1,16 @@
+from dataclasses import dataclass, field
 from pathlib import Path
 
 from xdsl.parser import GenericParser, ParserState
 from xdsl.utils.lexer import Input
 
-from .ast_nodes import BinaryExprAST, CallExprAST, ExprAST, FunctionAST, IfExprAST, ModuleAST, NumberExprAST, PrintExprAST, PrototypeAST, StringExprAST, VariableExprAST
-from .lexer import AzizLexer, AzizToken, AzizTokenKind
+from .ast_arena import AstArena
+from .ast_nodes import AstBuilder, ExprAST, FunctionAST, LineIndex, ModuleAST
+from .lexer import AzizLexer, AzizToken, AzizTokenKind, MappedSource
 
 
 class AzizParser(GenericParser[AzizTokenKind]):
-    def __init__(self, file: Path, program: str):
+    def __init__(self, file: Path, program: str | MappedSource, arena: bool = False):
         """
         (0) calling `AzizParser` constructor
 
@@ -35,15 +37,23 @@ class AzizParser(GenericParser[AzizTokenKind]):
             └─> self._parser_state = ParserState(...)
 
         (5) then we can call `.parse_module()` to parse the module
+
+        `program` can also be a `MappedSource`, then the file is tokenized in place and only the
+        text the ast keeps gets decoded. it has to stay open until `.parse_module()` returns.
+
+        with `arena`, the ast is built into the arrays of an `AstArena` instead of one object per node, and the
+        returned module hands out views of it.
         """
         super().__init__(ParserState(AzizLexer(Input(program, str(file)))))
+        self.lines = LineIndex(str(file), program.data if isinstance(program, MappedSource) else program)
+        self.nodes = AstArena(self.lines) if arena else AstBuilder(self.lines)
 
     def parse_module(self) -> ModuleAST:  # entry point
         # module ::= ( top_level* )
         ops = []
         while self._current_token.kind != AzizTokenKind.EOF:
             ops.append(self.parse_top_level())
-        return ModuleAST(tuple(ops))
+        return self.nodes.module(ops)
 
     def parse_top_level(self) -> FunctionAST | ExprAST:
         # top_level ::= definition | expression
@@ -55,12 +65,12 @@ class AzizParser(GenericParser[AzizTokenKind]):
         # list ::= '(' ( definition | expression_list ) ')'
         # definition ::= 'defun' identifier '(' identifier* ')' expression*
         # expression_list ::= operator expression* | function_call
-        paren_loc = self._pop(AzizTokenKind.PAREN_OPEN).span.get_location()
+        paren_offset = self._offset(self._pop(AzizTokenKind.PAREN_OPEN))
         if self._current_token.kind == AzizTokenKind.DEFUN:
-            return self.parse_defun(paren_loc)
-        return self.parse_expr_list_content(paren_loc)
+            return self.parse_defun(paren_offset)
+        return self.parse_expr_list_content(paren_offset)
 
-    def parse_defun(self, loc) -> FunctionAST:
+    def parse_defun(self, offset: int) -> FunctionAST:
         # defun ::= '(' 'defun' name '(' args* ')' body* ')'
         self._pop(AzizTokenKind.DEFUN)
         name_token = self._pop(AzizTokenKind.IDENTIFIER)
@@ -79,58 +89,63 @@ class AzizParser(GenericParser[AzizTokenKind]):
 
         self._pop(AzizTokenKind.PAREN_CLOSE)
 
-        proto = PrototypeAST(loc, name, args)
-        return FunctionAST(loc, proto, tuple(body))
+        return self.nodes.function(offset, name, args, body)
 
     def parse_expression(self) -> ExprAST:
         # expression ::= list | atom
         if self._current_token.kind == AzizTokenKind.PAREN_OPEN:
-            start_loc = self._pop(AzizTokenKind.PAREN_OPEN).span.get_location()
-            return self.parse_expr_list_content(start_loc)
+            start_offset = self._offset(self._pop(AzizTokenKind.PAREN_OPEN))
+            return self.parse_expr_list_content(start_offset)
         return self.parse_atom()
 
-    def parse_expr_list_content(self, start_loc) -> ExprAST:
+    def parse_expr_list_content(self, start_offset: int) -> ExprAST:
         # expr_list_content ::= 'print' expression
         #                     | 'if' expression expression expression
         #                     | binary_op expression expression
         #                     | function_name expression*
+        #
+        # nested lists are kept on an explicit stack instead of recursing, so the nesting depth isn't bound by python's
+        # recursion limit. a list is closed as soon as it has all its operands (calls: at the closing paren).
+        stack = [self._open_list(start_offset)]
+        while True:
+            while stack[-1].is_complete(self._current_token.kind):
+                self._pop(AzizTokenKind.PAREN_CLOSE)
+                expr = stack.pop().build(self.nodes)
+                if not stack:
+                    return expr
+                stack[-1].operands.append(expr)
+
+            # next operand of the innermost open list
+            if self._current_token.kind == AzizTokenKind.PAREN_OPEN:
+                stack.append(self._open_list(self._offset(self._pop(AzizTokenKind.PAREN_OPEN))))
+            else:
+                stack[-1].operands.append(self.parse_atom())
+
+    def _open_list(self, start_offset: int) -> "_OpenList":
+        # consumes the head of a list whose opening paren was popped
         if self._current_token.kind == AzizTokenKind.PRINT:
             self._pop(AzizTokenKind.PRINT)
-            arg = self.parse_expression()
-            self._pop(AzizTokenKind.PAREN_CLOSE)
-            return PrintExprAST(start_loc, arg)
+            return _OpenList(start_offset, "print", None, 1)
 
         if self._current_token.kind == AzizTokenKind.IF:
             self._pop(AzizTokenKind.IF)
-            cond = self.parse_expression()
-            then_expr = self.parse_expression()
-            else_expr = self.parse_expression()
-            self._pop(AzizTokenKind.PAREN_CLOSE)
-            return IfExprAST(start_loc, cond, then_expr, else_expr)
+            return _OpenList(start_offset, "if", None, 3)
 
         if self._current_token.kind == AzizTokenKind.IDENTIFIER:
-            head = self._pop(AzizTokenKind.IDENTIFIER)
-            name = head.text
+            name = self._pop(AzizTokenKind.IDENTIFIER).text
 
             # binary operators
             if name in ("+", "*", "-", "/", "%", "<", ">", "<=", ">=", "==", "!="):
-                lhs = self.parse_expression()
-                rhs = self.parse_expression()
-                self._pop(AzizTokenKind.PAREN_CLOSE)
-                return BinaryExprAST(start_loc, name, lhs, rhs)
+                return _OpenList(start_offset, "binary", name, 2)
 
             # generic function call
-            args: list[ExprAST] = []
-            while self._current_token.kind != AzizTokenKind.PAREN_CLOSE:
-                args.append(self.parse_expression())
-            self._pop(AzizTokenKind.PAREN_CLOSE)
-            return CallExprAST(start_loc, name, args)
+            return _OpenList(start_offset, "call", name, None)
 
         # handle other cases or errors
         if self._current_token.kind == AzizTokenKind.PAREN_CLOSE:
-            self.raise_error("empty lists (nil) not supported as expressions", self._current_token)
+            self.raise_error("empty lists (nil) not supported as expressions", self._current_token.span)
 
-        self.raise_error(f"unexpected token in list: {self._current_token.kind}", self._current_token)
+        self.raise_error(f"unexpected token in list: {self._current_token.kind}", self._current_token.span)
 
     def parse_atom(self) -> ExprAST:
         # atom ::= number | string | identifier
@@ -141,17 +156,46 @@ class AzizParser(GenericParser[AzizTokenKind]):
                 val = int(token.text)
             except ValueError:
                 val = float(token.text)
-            return NumberExprAST(token.span.get_location(), val)
+            return self.nodes.number(self._offset(token), val)
 
         if token.kind == AzizTokenKind.STRING:
             self._consume_token()
-            return StringExprAST(token.span.get_location(), token.text[1:-1])  # strip quotes
+            span, content = token.span, token.span.input.content
+            val = content.data[span.start + 1 : span.end - 1] if isinstance(content, MappedSource) else token.text[1:-1]  # strip quotes
+            return self.nodes.string(self._offset(token), val)
 
         if token.kind == AzizTokenKind.IDENTIFIER:
             self._consume_token()
-            return VariableExprAST(token.span.get_location(), token.text)
+            return self.nodes.variable(self._offset(token), token.text)
 
-        self.raise_error(f"unexpected token: {token.kind}", token)
+        self.raise_error(f"unexpected token: {token.kind}", token.span)
+
+    def _offset(self, token: AzizToken) -> int:
+        return token.span.start
 
     def _pop(self, kind: AzizTokenKind) -> AzizToken:  # verify type
         return self._parse_token(kind, f"expected {kind}")  # calls GenericParser._parse_token
+
+
+@dataclass(slots=True)
+class _OpenList:
+    # a list expression whose operands are being parsed
+    offset: int
+    kind: str  # print | if | binary | call
+    name: str | None  # operator or callee
+    arity: int | None  # None: any number of operands, up to the closing paren
+    operands: list[ExprAST] = field(default_factory=list)
+
+    def is_complete(self, next_token: AzizTokenKind) -> bool:
+        return next_token == AzizTokenKind.PAREN_CLOSE if self.arity is None else len(self.operands) == self.arity
+
+    def build(self, nodes: AstBuilder | AstArena) -> ExprAST:
+        match self.kind:
+            case "print":
+                return nodes.print(self.offset, *self.operands)
+            case "if":
+                return nodes.if_(self.offset, *self.operands)
+            case "binary":
+                return nodes.binary(self.offset, self.name, *self.operands)
+            case _:
+                return nodes.call(self.offset, self.name, self.operands)
@@ -0,0 +1,208 @@
+import json
+from io import StringIO
+
+from cache import ArtifactCache
+from dialects import aziz
+from frontend.ast_nodes import ModuleAST, dump
+from frontend.ir_gen import function_asts
+from xdsl.dialects import func, llvm, riscv, riscv_func
+from xdsl.dialects.builtin import FunctionType, ModuleOp, StringAttr
+from xdsl.ir import Operation
+
+# function-granular compilation, used instead of whole-module lowering when the pipeline has an artifact cache.
+#
+#   fingerprint ─> lowered function text (cached) ─> link
+#
+# every function is fingerprinted by its ast and the signatures IRGen generated it against. the backends lower each
+# function in a module of its own, cache the printed result under its fingerprint and link the pieces back together.
+# after a local edit only the changed functions and the functions that inline them are lowered again.
+#
+# labels and string globals of a function are prefixed with its name and a `$`, so the pieces don't collide when linked.
+# identifiers can't contain `$`, so no prefixed symbol is or looks like a function name (`.aziz.str.main$0`, not
+# `.aziz.str.main.0`, which a lookup of "main" could match).
+
+
+def fingerprints(module_ast: ModuleAST, module_op: ModuleOp) -> dict[str, str]:
+    # function name -> everything its generated ir depends on
+    funcs = _functions(module_op)
+    order = {name: i for i, name in enumerate(funcs)}
+    fingerprints = {}
+    for func_ast in function_asts(module_ast):
+        name = func_ast.proto.name
+        # IRGen sees the final signature of functions generated before this one, the declared one otherwise
+        seen = [f"{c}: {funcs[c].function_type} {order[c] < order[name]}" for c in sorted(_callees(funcs[name]))]
+        fingerprints[name] = "\n".join([dump(func_ast), str(funcs[name].function_type), *seen])
+    return fingerprints
+
+
+#
+# llvm: no inlining, every function is lowered on its own
+#
+
+
+def llvm_mlir(module_ast: ModuleAST, module_op: ModuleOp, cache: ArtifactCache) -> str:
+    from rewrites.callgraph import CallGraph
+
+    live = CallGraph(module_op).live()
+    funcs = {name: op for name, op in _functions(module_op).items() if name in live}
+    types = {name: op.function_type for name, op in funcs.items()}
+    material = fingerprints(module_ast, module_op)
+
+    symbols: dict[str, str] = {}  # globals and external declarations, shared between functions
+    bodies: list[str] = []
+    for name, func_op in funcs.items():
+        piece = json.loads(_cached(cache, material[name], "fn_llvm", lambda: lower_llvm_function(func_op, types)))
+        symbols.update(piece["symbols"])
+        bodies.append(piece["body"])
+
+    # the same format as printing the whole lowered module
+    ops = [*(v for k, v in symbols.items() if k != "printf"), *bodies, *([symbols["printf"]] if "printf" in symbols else [])]
+    return "builtin.module {\n" + "\n".join("  " + line for op in ops for line in op.splitlines()) + "\n}"
+
+
+def declared_unit(func_op: aziz.FuncOp, types: dict[str, FunctionType]) -> ModuleOp:
+    # module of a copy of `func_op`. calls must resolve, so its callees are declared
+    name = func_op.sym_name.data
+    unit = ModuleOp([func_op.clone()])
+    convert_type = lambda t: llvm.LLVMPointerType() if isinstance(t, aziz.StringType) else t
+    for callee in sorted(_callees(func_op) - {name}):
+        callee_type = types[callee]
+        inputs, outputs = [convert_type(t) for t in callee_type.inputs], [convert_type(t) for t in callee_type.outputs]
+        unit.body.block.add_op(func.FuncOp.external(callee, inputs, outputs))
+    return unit
+
+
+def lower_llvm_function(func_op: aziz.FuncOp, types: dict[str, FunctionType]) -> dict:
+    # {"symbols": name -> printed global or external declaration, "body": printed lowered function}, given the types
+    # of the functions it calls
+    from pipeline import lower_llvm_mut
+
+    name = func_op.sym_name.data
+    unit = declared_unit(func_op, types)
+    lower_llvm_mut(unit, remove_dead=False, prefix=_prefix(name))
+
+    piece = {"symbols": {}, "body": None}
+    for op in unit.body.block.ops:
+        if isinstance(op, func.FuncOp) and op.sym_name.data == name:
+            piece["body"] = str(op)
+        elif isinstance(op, (llvm.GlobalOp, llvm.FuncOp)):
+            piece["symbols"][op.sym_name.data] = str(op)
+    return piece
+
+
+#
+# riscv: functions inline their non-recursive callees, so a function's code depends on every function it reaches
+#
+
+
+def riscv_asm(module_ast: ModuleAST, module_op: ModuleOp, cache: ArtifactCache) -> str:
+    from rewrites.lower_riscv import format_assembly
+
+    funcs = _functions(module_op)
+    material = fingerprints(module_ast, module_op)
+    graph = {name: _callees(op) for name, op in funcs.items()}
+    material = {name: "\n\n".join(material[n] for n in funcs if n in _reachable(name, graph)) for name in funcs}
+
+    # functions that aren't reachable from a public one through the calls that survive inlining are dropped, see
+    # `CallGraph.live`. only the reached functions are inlined
+    units: dict[str, ModuleOp] = {}  # inlined in this build, lowered below
+    live = {name for name, op in funcs.items() if op.sym_visibility != StringAttr("private")}
+    stack = list(live)
+    while stack:
+        name = stack.pop()
+
+        def calls() -> list[str]:
+            units[name] = _inline_riscv(name, funcs, graph)
+            return sorted({c for op in units[name].body.block.ops for c in _callees(op)})
+
+        for callee in set(json.loads(_cached(cache, material[name], "fn_riscv_calls", calls))) - live:
+            live.add(callee)
+            stack.append(callee)
+    kept = [name for name in funcs if name in live]
+
+    data, text, runtime = [], [], ""
+    for name in kept:
+        build = lambda: lower_riscv_function(name, units.pop(name, None) or _inline_riscv(name, funcs, graph))
+        piece = json.loads(_cached(cache, material[name], "fn_riscv", build))
+        data.append(piece["data"])
+        text.append(piece["text"])
+        runtime = runtime or piece["runtime"]
+
+    return format_assembly("".join(data) + ".text\n" + "".join(text) + runtime)
+
+
+def _inline_riscv(name: str, funcs: dict[str, aziz.FuncOp], graph: dict[str, set[str]]) -> ModuleOp:
+    # module of `name` and everything it reaches, after inlining
+    from pipeline import optimize_aziz_mut
+
+    reachable = _reachable(name, graph)
+    unit = ModuleOp([op.clone() for n, op in funcs.items() if n in reachable])  # in module order, inlining depends on it
+    target = next(op for op in unit.body.block.ops if op.sym_name.data == name)
+
+    # public while optimizing, it has no callers in here
+    visibility = target.attributes.pop("sym_visibility", None)
+    optimize_aziz_mut(unit)
+    if visibility is not None:
+        target.attributes["sym_visibility"] = visibility
+    return unit
+
+
+def lower_riscv_function(name: str, unit: ModuleOp) -> dict:
+    # {"data", "text", "runtime"} assembly of function `name` of `unit`, lowered without optimizing
+    from pipeline import lower_aziz_mut, lower_riscv_mut
+
+    lower_aziz_mut(unit, optimize=False, prefix=_prefix(name))
+    lower_riscv_mut(unit, prefix=_prefix(name))
+
+    # data directives come before the first function, the print runtime after all functions
+    ops = list(unit.body.block.ops)
+    first_func = next(i for i, op in enumerate(ops) if isinstance(op, riscv_func.FuncOp))
+    is_runtime = lambda op: isinstance(op, riscv_func.FuncOp) and op.sym_name.data.startswith("_print_")
+    return {
+        "data": _print_asm(ops[: first_func - 1]),  # without the `.text` directive
+        "text": _print_asm([op for op in ops if isinstance(op, riscv_func.FuncOp) and op.sym_name.data == name]),
+        "runtime": _print_asm([op for op in ops if is_runtime(op)]),
+    }
+
+
+#
+# utils
+#
+
+
+def _cached(cache: ArtifactCache, material: str, stage: str, build) -> str:
+    key = cache.key(material)
+    if (data := cache.get(key, stage)) is not None:
+        return data.decode()
+    data = json.dumps(build())
+    cache.put(key, stage, data.encode())
+    return data
+
+
+def _prefix(name: str) -> str:
+    return f"{name}$"
+
+
+def _functions(module_op: ModuleOp) -> dict[str, aziz.FuncOp]:
+    return {op.sym_name.data: op for op in module_op.body.block.ops if isinstance(op, aziz.FuncOp)}
+
+
+def _callees(op: Operation) -> set[str]:
+    return {o.callee.string_value() for o in op.walk() if isinstance(o, aziz.CallOp)}
+
+
+def _reachable(name: str, graph: dict[str, set[str]]) -> set[str]:
+    seen, stack = {name}, [name]
+    while stack:
+        for callee in graph[stack.pop()] - seen:
+            seen.add(callee)
+            stack.append(callee)
+    return seen
+
+
+def _print_asm(ops: list[Operation]) -> str:
+    for op in ops:
+        op.detach()
+    io = StringIO()
+    riscv.print_assembly(ModuleOp(ops), io)
+    return io.getvalue()
@@ -1,6 +1,7 @@
 from typing import Any
 
 from dialects import aziz as ops
+from rewrites.canonicalize import wrap
 from xdsl.interpreter import Interpreter, InterpreterFunctions, ReturnedValues, impl, impl_callable, impl_terminator, register_impls
 
 
@@ -8,15 +9,15 @@ from xdsl.interpreter import Interpreter, InterpreterFunctions, ReturnedValues,
 class AzizFunctions(InterpreterFunctions):
     @impl(ops.AddOp)
     def run_add(self, i: Interpreter, op: ops.AddOp, args: tuple[Any, ...]):
-        return (args[0] + args[1],)
+        return (wrap(args[0] + args[1], op.res.type),)
 
     @impl(ops.MulOp)
     def run_mul(self, i: Interpreter, op: ops.MulOp, args: tuple[Any, ...]):
-        return (args[0] * args[1],)
+        return (wrap(args[0] * args[1], op.res.type),)
 
     @impl(ops.SubOp)
     def run_sub(self, i: Interpreter, op: ops.SubOp, args: tuple[Any, ...]):
-        return (args[0] - args[1],)
+        return (wrap(args[0] - args[1], op.res.type),)
 
     @impl(ops.LessThanEqualOp)
     def run_le(self, i: Interpreter, op: ops.LessThanEqualOp, args: tuple[Any, ...]):
@@ -55,6 +56,19 @@ class AzizFunctions(InterpreterFunctions):
         else:
             return i.run_ssacfg_region(op.else_region, (), "else")
 
+    @impl(ops.LoopOp)
+    def run_loop(self, i: Interpreter, op: ops.LoopOp, args: tuple[Any, ...]):
+        n = len(op.inits)
+        while True:
+            again, *values = i.run_ssacfg_region(op.body, args, "loop")
+            if not again:
+                return tuple(values[n:])
+            args = tuple(values[:n])
+
+    @impl_terminator(ops.LoopConditionOp)
+    def run_loop_condition(self, i: Interpreter, op: ops.LoopConditionOp, args: tuple[Any, ...]):
+        return ReturnedValues(args), ()
+
     @impl(ops.CastIntToFloatOp)
     def run_cast_int_to_float(self, i: Interpreter, op: ops.CastIntToFloatOp, args: tuple[Any, ...]):  # only called by ir_gen
         return (float(args[0]),)
@@ -1,29 +1,72 @@
+import os
 import subprocess
 import tempfile
+from pathlib import Path
+from typing import Callable, TextIO
 
+from timing import run_tool
 
-def execute_llvm(module_op_llvm):
-    res = subprocess.run(["mlir-opt", "--convert-scf-to-cf", "--convert-func-to-llvm", "--convert-arith-to-llvm", "--convert-cf-to-llvm", "--reconcile-unrealized-casts"], input=str(module_op_llvm), capture_output=True, text=True)
+TOOLS = ("mlir-opt", "mlir-translate", "llc", "clang")
+MLIR_OPT = ["mlir-opt", "--convert-scf-to-cf", "--convert-func-to-llvm", "--convert-arith-to-llvm", "--convert-cf-to-llvm", "--reconcile-unrealized-casts"]
+MLIR_TRANSLATE = ["mlir-translate", "--mlir-to-llvmir"]
+
+
+def translate_llvm(module_op_llvm) -> str:
+    # accepts the lowered module or its printed text
+    res = run_tool(MLIR_OPT, input=str(module_op_llvm), capture_output=True, text=True)
     assert res.returncode == 0, f"mlir-opt failed:\n{res.stderr}"
     mlir_opt = res.stdout
 
-    res = subprocess.run(["mlir-translate", "--mlir-to-llvmir"], input=mlir_opt, capture_output=True, text=True)
+    res = run_tool(MLIR_TRANSLATE, input=mlir_opt, capture_output=True, text=True)
     assert res.returncode == 0, f"mlir-translate failed:\n{res.stderr}"
-    llvm_ir = res.stdout
-
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".ll", delete=False) as f:
-        f.write(llvm_ir)
-        ll_path = f.name
-
-    obj_path = ll_path.replace(".ll", ".o")
-    res = subprocess.run(["llc", "-filetype=obj", "-o", obj_path, ll_path], capture_output=True, text=True)
-    assert res.returncode == 0, f"llc failed:\n{res.stderr}"
-    with tempfile.NamedTemporaryFile(delete=False) as f:
-        output_file = f.name
-    res = subprocess.run(["clang", "-o", output_file, obj_path], capture_output=True, text=True)
-    assert res.returncode == 0, f"clang failed:\n{res.stderr}"
-
-    res = subprocess.run([output_file], capture_output=True, text=True)
-    llvm_exec_out = res.stdout
-    llvm_exec_err = res.stderr
+    return res.stdout
+
+
+def translate_llvm_streaming(write: Callable[[TextIO], None], out: TextIO):
+    # `translate_llvm` piping the module into the tools while `write` produces it, the llvm ir goes to `out`
+    mlir_opt = subprocess.Popen(MLIR_OPT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    mlir_translate = subprocess.Popen(MLIR_TRANSLATE, stdin=mlir_opt.stdout, stdout=out)
+    mlir_opt.stdout.close()  # only mlir-translate reads it
+    try:
+        write(mlir_opt.stdin)
+    finally:
+        mlir_opt.stdin.close()
+    assert mlir_opt.wait() == 0, "mlir-opt failed"
+    assert mlir_translate.wait() == 0, "mlir-translate failed"
+
+
+def compile_object(llvm_ir: str) -> bytes:
+    with tempfile.TemporaryDirectory() as tmp_dir_str:
+        tmp = Path(tmp_dir_str)
+        (tmp / "code.ll").write_text(llvm_ir)
+        res = run_tool(["llc", "-filetype=obj", "-o", tmp / "code.o", tmp / "code.ll"], capture_output=True, text=True)
+        assert res.returncode == 0, f"llc failed:\n{res.stderr}"
+        return (tmp / "code.o").read_bytes()
+
+
+def link_executable(obj: bytes) -> bytes:
+    with tempfile.TemporaryDirectory() as tmp_dir_str:
+        tmp = Path(tmp_dir_str)
+        (tmp / "code.o").write_bytes(obj)
+        res = run_tool(["clang", "-o", tmp / "code", tmp / "code.o"], capture_output=True, text=True)
+        assert res.returncode == 0, f"clang failed:\n{res.stderr}"
+        return (tmp / "code").read_bytes()
+
+
+def run_executable(exe: bytes) -> tuple[str, str]:
+    with tempfile.TemporaryDirectory() as tmp_dir_str:
+        exe_path = Path(tmp_dir_str) / "code"
+        exe_path.write_bytes(exe)
+        os.chmod(exe_path, 0o755)
+        res = run_tool([exe_path], name="llvm executable", capture_output=True, text=True)
+        return res.stdout, res.stderr
+
+
+def run_llvm(llvm_ir: str) -> tuple[str, str]:
+    return run_executable(link_executable(compile_object(llvm_ir)))
+
+
+def execute_llvm(module_op_llvm):
+    llvm_ir = translate_llvm(module_op_llvm)
+    llvm_exec_out, llvm_exec_err = run_llvm(llvm_ir)
     return llvm_ir, llvm_exec_out, llvm_exec_err
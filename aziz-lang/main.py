@@ -8,162 +8,179 @@
 # ///
 
 import argparse
-from contextlib import redirect_stdout
-from functools import lru_cache
-from io import StringIO
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from dialects import aziz
-from frontend.ast_nodes import dump
-from frontend.ir_gen import IRGen
-from frontend.parser import AzizParser
-from interpreter import AzizFunctions
-from llvm_exec import execute_llvm
-from qemu import emulate_riscv
-from rewrites.lower import LowerAzizPass
-from rewrites.lower_llvm import LowerPrintfToLLVMCallPass
-from rewrites.lower_riscv import AddPrintRuntimePass, AddRecursionSupportPass, CustomLowerScfToRiscvPass, EmitDataSectionPass, LowerPrintfPass, LowerSelectPass, MapToPhysicalRegistersPass, RemoveUnprintableOpsPass, format_assembly
-from rewrites.optimize import OptimizeAzizPass
-from xdsl.backend.riscv.lowering.convert_arith_to_riscv import ConvertArithToRiscvPass
-from xdsl.backend.riscv.lowering.convert_func_to_riscv_func import ConvertFuncToRiscvFuncPass
-from xdsl.backend.riscv.lowering.convert_memref_to_riscv import ConvertMemRefToRiscvPass
-from xdsl.backend.riscv.lowering.convert_riscv_scf_to_riscv_cf import ConvertRiscvScfToRiscvCfPass
-from xdsl.context import Context
-from xdsl.dialects import affine, arith, func, printf, riscv, riscv_func, riscv_scf, scf
-from xdsl.dialects.builtin import Builtin, ModuleOp
-from xdsl.interpreter import Interpreter
-from xdsl.transforms.canonicalize import CanonicalizePass
-from xdsl.transforms.dead_code_elimination import DeadCodeElimination
-from xdsl.transforms.lower_affine import LowerAffinePass
-from xdsl.transforms.lower_riscv_func import LowerRISCVFunc
-from xdsl.transforms.reconcile_unrealized_casts import ReconcileUnrealizedCastsPass
-from xdsl.transforms.riscv_allocate_registers import RISCVAllocateRegistersPass
+from cache import CACHE_DIR, MAX_CACHE_BYTES, ArtifactCache
+from server import SOCKET_PATH, CompileServerError, compile_remote, serve
+
+# cli flag -> (block title, stage)
+STAGES: dict[str, tuple[str, str]] = {
+    "emit_source": ("source", "src"),
+    "emit_ast": ("ast", "ast_dump"),
+    "emit_mlir": ("aziz dialect mlir", "mlir"),
+    "emit_llvm": ("llvm ir", "llvm_ir"),
+    "emit_riscv": ("riscv assembly", "riscv_asm"),
+    "inline_report": ("inlining", "inline_report"),
+    "interpret": ("interpreter output", "interpreter_output"),
+    "execute_riscv": ("riscv emulator output", "emulator_output"),
+    "execute_llvm": ("llvm output", "llvm_output"),
+    # last, so they cover all other stages
+    "memory": ("memory", "memory_report"),
+    "timing": ("timing", "timing_report"),
+}
+
+# output stage -> backend, for `--json`
+OUTPUTS: dict[str, str] = {
+    "interpreter_output": "interpreter",
+    "llvm_output": "llvm",
+    "emulator_output": "riscv",
+}
 
 
 def main():
     parser = argparse.ArgumentParser(description="aziz language")
-    parser.add_argument("file", help="source file")
+    parser.add_argument("files", nargs="*", help="source files or directories of source files")
     # lowerings
     parser.add_argument("--emit-source", action="store_true", help="emit source code")
     parser.add_argument("--emit-ast", action="store_true", help="emit abstract syntax tree")
     parser.add_argument("--emit-mlir", action="store_true", help="emit mlir before and after optimization")
     parser.add_argument("--emit-riscv", action="store_true", help="emit RISC-V assembly")
     parser.add_argument("--emit-llvm", action="store_true", help="compile via LLVM pipeline")
+    parser.add_argument("--inline-report", action="store_true", help="report which calls the inliner inlines and why")
     # output should be identical
     parser.add_argument("--interpret", action="store_true", help="interpret aziz mlir")
     parser.add_argument("--execute-llvm", action="store_true", help="execute LLVM executable")
     parser.add_argument("--execute-riscv", action="store_true", help="execute RISC-V assembly in qemu emulator")
     parser.add_argument("--all", action="store_true", help="emit all stages")
+    parser.add_argument("--timing", action="store_true", help="report wall time and op counts per pass and external tool call")
+    parser.add_argument("--memory", action="store_true", help="report python heap peaks, rss deltas and external tool input sizes per pass and tool (slows compilation down)")
+    parser.add_argument("--json", action="store_true", help="print one json document per file: artifacts, outputs, exit status, timings and peak memory")
+    parser.add_argument("--parallel", action="store_true", help="run the LLVM and RISC-V backends concurrently and parse large files on all cores")
+    parser.add_argument("--stream", action="store_true", help="with --emit-riscv or --emit-llvm: compile function by function in bounded memory, straight to stdout. parse errors, undefined names and wrong argument counts are reported before any output, type errors end the output at their function")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="worker processes when compiling many files (default: cpu count)")
+    # artifact cache
+    parser.add_argument("--cache", action="store_true", help="reuse compile artifacts from the on-disk cache")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR, help="artifact cache directory")
+    parser.add_argument("--cache-size", type=int, default=MAX_CACHE_BYTES // 2**20, help="artifact cache size limit in MB")
+    # compile server
+    parser.add_argument("--serve", action="store_true", help="run a persistent compile server on --socket")
+    parser.add_argument("--socket", type=Path, default=SOCKET_PATH, help="compile server socket path")
+    parser.add_argument("--no-server", action="store_true", help="compile in-process even if a compile server is running")
     args = parser.parse_args()
 
+    if args.serve:
+        serve(args.socket)
+        return
+    if not args.files:
+        parser.error("the following arguments are required: files")
+
     if args.all:
         args.emit_source = args.emit_ast = args.emit_mlir = args.emit_llvm = args.emit_riscv = True
         args.interpret = args.execute_riscv = args.execute_llvm = True
-
-    assert args.file.endswith(".aziz")
-    src = Path(args.file).read_text()
-
-    # source -> ast -> aziz dialect
-    module_ast = AzizParser(None, src).parse_module()
-    module_op = IRGen().ir_gen_module(module_ast)
-
-    # interpret
-    captured_output = StringIO()
-    interpreter = Interpreter(module_op)
-    interpreter.register_implementations(AzizFunctions())
-    with redirect_stdout(captured_output):
-        interpreter.call_op("main", ())
-    interpreter_result = captured_output.getvalue()
-
-    # a) aziz dialect -> lowered aziz mlir -> llvm dialect mlir (mlir-opt) -> llvm ir (mlir-translate) -> executable (llc + clang) -> execute
-    module_op_llvm = module_op.clone()
-    lower_llvm_mut(module_op_llvm)
-    llvm_ir, llvm_exec_out, llvm_exec_err = execute_llvm(module_op_llvm)
-
-    # b) aziz dialect -> lowered aziz mlir -> riscv dialect mlir -> riscv assembly codegen -> execute in qemu
-    module_op_riscv = module_op.clone()
-    lower_aziz_mut(module_op_riscv)
-    lower_riscv_mut(module_op_riscv)
-    io = StringIO()
-    riscv.print_assembly(module_op_riscv, io)
-    riscv_asm = format_assembly(io.getvalue())  # Rename riscv_ir -> riscv_asm for consistency
-    emulator_result = emulate_riscv(riscv_asm, entry_symbol="main")
+        args.parallel = True
+
+    files = collect_sources(args.files)
+
+    if args.stream:
+        # one backend, output as it's produced. no other stages, no server and no cache
+        if args.emit_llvm == args.emit_riscv:
+            parser.error("--stream needs exactly one of --emit-llvm and --emit-riscv")
+        from frontend.ir_gen import IRGenError
+        from streaming import stream, stream_llvm_ir
+        from xdsl.utils.exceptions import ParseError, VerifyException
+
+        for file in files:
+            if len(files) > 1:
+                print(f"\n{'-' * 60} {file}\n", flush=True)
+            try:
+                stream_llvm_ir(file, sys.stdout) if args.emit_llvm else stream(file, "riscv", sys.stdout)
+            except (ParseError, IRGenError, VerifyException) as e:
+                sys.stdout.flush()  # whatever was written before the error, then the error
+                sys.exit(f"error: {e}" if isinstance(e, ParseError) else f"error: {file}: {e}")  # parse errors have their position
+        return
+    cache = ArtifactCache(args.cache_dir, args.cache_size * 2**20) if args.cache else None
+
+    # only the stages behind the requested flags (and their dependencies) get built
+    requested = [flag for flag in STAGES if getattr(args, flag)]
+    stages = [STAGES[flag][1] for flag in requested]
+    if args.json:
+        # structured timings (with memory fields if `--memory`) instead of the tables, peak memory once everything else ran
+        stages = [s for s in stages if s != "timing_report"] + ["timings", "peak_memory"]
 
     # print
     w = 50
     print_block = lambda title, content: print(f"\033[90m╭{'─' * w}╮\033[0m\n\033[90m│{' ' * ((w - len(title) - 2) // 2)} {title} {' ' * (w - len(title) - 2 - (w - len(title) - 2) // 2)}│\033[0m\n\033[90m╰{'─' * w}╯\033[0m\n\n{content}\n")
-    if args.emit_source:
-        print_block("source", src)
-    if args.emit_ast:
-        print_block("ast", dump(module_ast))
-    if args.emit_mlir:
-        print_block("aziz dialect mlir", module_op)
-    if args.emit_llvm:
-        print_block("llvm ir", llvm_ir)
-    if args.emit_riscv:
-        print_block("riscv assembly", riscv_asm)
-    if args.interpret:
-        print_block("interpreter output", interpreter_result)
-    if args.execute_riscv:
-        print_block("riscv emulator output", emulator_result)
-    if args.execute_llvm:
-        print_block("llvm output", llvm_exec_out)
-        assert not llvm_exec_err, f"llvm produced stderr: {llvm_exec_err}"
-
-
-def lower_aziz_mut(module_op: ModuleOp):
-    ctx = context()
-    OptimizeAzizPass().apply(ctx, module_op)  # drop unused functions, inline one-liner functions
-    LowerAzizPass().apply(ctx, module_op)  # lower to arith, func, scf, printf, llvm.global for strings
-    LowerAffinePass().apply(ctx, module_op)
-    CanonicalizePass().apply(ctx, module_op)  # automatically look up and apply canonicalization patterns for each op
-    module_op.verify()
-
-
-def lower_llvm_mut(module_op: ModuleOp):
-    ctx = context()
-    LowerAzizPass().apply(ctx, module_op)
-    LowerAffinePass().apply(ctx, module_op)
-    CanonicalizePass().apply(ctx, module_op)
-    LowerPrintfToLLVMCallPass().apply(ctx, module_op)
-    module_op.verify()
-
-
-def lower_riscv_mut(module_op: ModuleOp):
-    ctx = context()
-    LowerSelectPass().apply(ctx, module_op)  # arith.select missing from xdsl lib
-    RemoveUnprintableOpsPass().apply(ctx, module_op)  # handle llvm.global and llvm.address_of for strings
-    EmitDataSectionPass().apply(ctx, module_op)
-    AddPrintRuntimePass().apply(ctx, module_op)
-    ConvertFuncToRiscvFuncPass().apply(ctx, module_op)  # func -> riscv_func
-    AddRecursionSupportPass().apply(ctx, module_op)
-    CustomLowerScfToRiscvPass().apply(ctx, module_op)  # replaces ConvertScfToRiscvPass
-    ConvertMemRefToRiscvPass().apply(ctx, module_op)  # memref -> riscv load/store
-    ConvertArithToRiscvPass().apply(ctx, module_op)  # arith -> riscv
-    LowerPrintfPass().apply(ctx, module_op)  # printf -> print runtime calls (after type conversion)
-    DeadCodeElimination().apply(ctx, module_op)  # dce
-    ReconcileUnrealizedCastsPass().apply(ctx, module_op)  # cleanup casts
-    RISCVAllocateRegistersPass(allow_infinite=True).apply(ctx, module_op)  # virtual -> physical registers
-    MapToPhysicalRegistersPass().apply(ctx, module_op)
-    LowerRISCVFunc(insert_exit_syscall=True).apply(ctx, module_op)  # riscv_func -> riscv labels and jumps
-    ConvertRiscvScfToRiscvCfPass().apply(ctx, module_op)
-    module_op.verify()
-
-
-@lru_cache(None)
-def context() -> Context:
-    ctx = Context()
-    ctx.load_dialect(aziz.Aziz)
-    ctx.load_dialect(affine.Affine)
-    ctx.load_dialect(arith.Arith)
-    ctx.load_dialect(Builtin)
-    ctx.load_dialect(func.Func)
-    ctx.load_dialect(printf.Printf)
-    ctx.load_dialect(riscv_func.RISCV_Func)
-    ctx.load_dialect(riscv_scf.RISCV_Scf)
-    ctx.load_dialect(riscv.RISCV)
-    ctx.load_dialect(scf.Scf)
-    return ctx
+
+    def print_results(results: dict[str, str]):
+        for flag in requested:
+            title, stage = STAGES[flag]
+            print_block(title, results[stage])
+
+    def print_batch(batch) -> bool:
+        # output stays grouped per file and in input order. with `--json` one line per file, failures included.
+        ok = True
+        for file, results in batch:
+            if args.json:
+                document = json_document(file, results)
+                ok &= document["exit_status"] == 0
+                print(json.dumps(document), flush=True)
+                continue
+            if len(files) > 1:
+                print(f"\n{'-' * 60} {file}\n")
+            print_results(results)
+        return ok
+
+    # thin client: forward to the compile server if one is listening
+    def remote(file: Path) -> dict | CompileServerError | None:
+        try:
+            return compile_remote(file, file.read_text(), stages, parallel=args.parallel, cache=cache, path=args.socket)
+        except CompileServerError as e:
+            if not args.json:
+                raise
+            return e
+
+    if not args.no_server and (first := remote(files[0])) is not None:
+        with ThreadPoolExecutor(args.jobs) as pool:  # the server forks per request
+            ok = print_batch(zip(files, [first, *pool.map(remote, files[1:])]))
+        sys.exit(0 if ok else 1)
+
+    from pipeline import run_batch
+
+    # batch: files are spread over a worker pool
+    ok = print_batch(run_batch(files, stages, jobs=args.jobs, cache=cache, parallel=args.parallel, return_exceptions=args.json))
+
+    if cache:
+        cache.evict()
+    sys.exit(0 if ok else 1)
+
+
+def json_document(file: Path, results: dict | Exception) -> dict:
+    # artifacts by stage, program output by backend
+    if isinstance(results, Exception):
+        return {"file": str(file), "exit_status": 1, "error": str(results)}
+    return {
+        "file": str(file),
+        "exit_status": 0,
+        "stages": {stage: v for stage, v in results.items() if stage not in OUTPUTS and stage not in ("memory_report", "timings", "peak_memory")},
+        "outputs": {OUTPUTS[stage]: v for stage, v in results.items() if stage in OUTPUTS},
+        "timings": results["timings"],
+        "peak_memory_bytes": results["peak_memory"],
+    }
+
+
+def collect_sources(paths: list[str]) -> list[Path]:
+    # files as given, directories expanded to their .aziz files in sorted order
+    sources = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            sources.extend(sorted(path.glob("*.aziz")))
+        else:
+            assert path.suffix == ".aziz", f"not an aziz source file: {path}"
+            sources.append(path)
+    return sources
 
 
 if __name__ == "__main__":
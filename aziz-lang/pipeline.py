@@ -0,0 +1,472 @@
+import importlib
+import os
+import pickle
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import asdict
+from functools import cached_property, lru_cache
+from io import StringIO
+from itertools import repeat
+from pathlib import Path
+from typing import Callable, Iterator
+
+import timing
+from cache import ArtifactCache
+from frontend.ast_nodes import ModuleAST, dump
+from frontend.ir_gen import IRGen
+from frontend.lexer import MappedSource
+from frontend.parallel import PARALLEL_PARSE_CHARS, parse_parallel
+from frontend.parser import AzizParser
+from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Dialect
+from xdsl.passes import ModulePass
+
+# backends (llvm_exec, qemu with unicorn and pyelftools, the riscv lowerings, the interpreter) are imported by the stages
+# that need them, so e.g. `--interpret` never pays for them. see `preload` for the opposite.
+
+#
+# stage graph
+#
+#   src ─> module_ast ─> module_op ─┬─> interpreter_output
+#                                   ├─> module_op_llvm ──> llvm_mlir ──> llvm_ir ──> llvm_obj ──> llvm_exe ──> llvm_output
+#                                   └─> module_op_riscv ─> riscv_asm ──> riscv_elf ─> emulator_output
+#
+# every stage is a `cached_property`, so requesting one builds exactly the stages it depends on (once).
+# with an `ArtifactCache`, compile artifacts are also looked up on disk before their dependencies are built,
+# so a run resumes from the deepest cached stage, and the backends only lower functions that changed (see `incremental`).
+# program outputs are never cached.
+#
+
+# summaries of the run itself, built after all other stages
+REPORTS = ("timing_report", "memory_report", "timings", "peak_memory")
+
+# printable stages of each backend, they only share `module_op` and can run concurrently
+BACKENDS: tuple[frozenset[str], ...] = (
+    frozenset({"llvm_ir", "llvm_output"}),
+    frozenset({"riscv_asm", "emulator_output"}),
+)
+
+
+class Pipeline:
+    def __init__(self, file: str | Path, src: str | None = None, cache: ArtifactCache | None = None):
+        self.file = Path(file)
+        self.cache = cache
+        self.parse_jobs = 1  # > 1: large sources are parsed by a process pool, see `frontend.parallel`
+        self.recorder = timing.Recorder()  # only records while a report of it is requested
+        if src is not None:
+            self.src = src  # shadows the cached property
+
+    def run(self, stages: list[str], parallel: bool = False) -> dict[str, str | list | int]:
+        # stage name -> printable artifact, only building what the requested stages depend on
+        self.recorder.memory = "memory_report" in stages
+        self.parse_jobs = (os.cpu_count() or 1) if parallel else 1
+        timed = self.recorder.memory or "timing_report" in stages or "timings" in stages
+        with self.recorder.active() if timed else nullcontext():
+            groups = [[s for s in stages if s in backend] for backend in BACKENDS]
+            groups = [g for g in groups if g]
+            if not parallel or len(groups) < 2:
+                return {stage: getattr(self, stage) for stage in stages}
+
+            # each backend rebuilds the aziz module from source in its own worker (ir can't be pickled),
+            # while the frontend-only stages run here. latency is the slowest backend, not the sum.
+            with ProcessPoolExecutor(len(groups)) as pool:
+                futures = [pool.submit(_run_stages, self.file, self.src, g, self.cache, timed, self.recorder.memory) for g in groups]
+                local = {stage: getattr(self, stage) for stage in stages if stage not in REPORTS and not any(stage in g for g in groups)}
+                for future in futures:
+                    results, measurements = future.result()
+                    local.update(results)
+                    self.recorder.measurements += measurements
+            return {stage: local[stage] if stage in local else getattr(self, stage) for stage in stages}
+
+    @cached_property
+    def src(self) -> str:
+        return self.file.read_text()
+
+    @cached_property
+    def module_ast(self) -> ModuleAST:
+        if (data := self._load("ast")) is not None:
+            return pickle.loads(data)
+        # into an arena (see `frontend.ast_arena`): a few arrays instead of an object per node, and pickled flat
+        with timing.measure("parse"):
+            size = len(self.src) if "src" in self.__dict__ else self.file.stat().st_size
+            if self.parse_jobs > 1 and size >= PARALLEL_PARSE_CHARS:
+                module_ast = parse_parallel(self.file, self.src, self.parse_jobs)
+            elif "src" in self.__dict__:  # given, or read for another stage anyway
+                module_ast = AzizParser(self.file, self.src, arena=True).parse_module()
+            else:
+                with MappedSource(self.file) as source:
+                    module_ast = AzizParser(self.file, source, arena=True).parse_module()
+        self._store("ast", lambda: pickle.dumps(module_ast))
+        return module_ast
+
+    @cached_property
+    def ast_dump(self) -> str:
+        return dump(self.module_ast)
+
+    @cached_property
+    def module_op(self) -> ModuleOp:
+        if (mlir := self._load("mlir")) is not None:
+            from xdsl.parser import Parser
+
+            return Parser(context(), mlir.decode()).parse_module()
+        module_ast = self.module_ast
+        with timing.measure("irgen"):
+            module_op = IRGen().ir_gen_module(module_ast)
+        self._store("mlir", lambda: str(module_op).encode())
+        return module_op
+
+    @cached_property
+    def mlir(self) -> str:
+        return str(self.module_op)
+
+    @cached_property
+    def inline_report(self) -> str:
+        # the inliner's decisions on the whole module, one row per caller, callee and decision (see `rewrites.optimize`)
+        from rewrites.optimize import inline_calls
+        from rewrites.tail_calls import EliminateTailCallsPass
+
+        with timing.measure("clone"):
+            module_op = self.module_op.clone()
+        apply_passes("inline-report", module_op, [EliminateTailCallsPass()])  # as in `OptimizeAzizPass`
+        decisions = inline_calls(module_op)
+        counts = Counter((d.caller, d.callee, str(d.callee_size), str(d.benefit), "inlined" if d.inlined else "kept", d.reason) for d in decisions)
+        rows = [("caller", "callee", "calls", "callee ops", "benefit", "decision", "reason")]
+        rows += [(caller, callee, str(n), *rest) for (caller, callee, *rest), n in counts.items()]
+        rows.append(("total", "", str(len(decisions)), "", "", f"{sum(d.inlined for d in decisions)} inlined", ""))
+        return timing.table(rows)
+
+    @cached_property
+    def interpreter_output(self) -> str:
+        from interpreter import AzizFunctions
+        from xdsl.interpreter import Interpreter
+
+        captured_output = StringIO()
+        with timing.measure("clone"):
+            module_op = self.module_op.clone()
+        optimize_aziz_mut(module_op)  # runs less code, `--emit-mlir` shows the unoptimized module
+        interpreter = Interpreter(module_op)
+        interpreter.register_implementations(AzizFunctions())
+        with redirect_stdout(captured_output), timing.measure("interpret"):
+            interpreter.call_op("main", ())
+        return captured_output.getvalue()
+
+    # a) aziz dialect -> lowered aziz mlir -> llvm dialect mlir (mlir-opt) -> llvm ir (mlir-translate) -> executable (llc + clang) -> execute
+
+    @cached_property
+    def module_op_llvm(self) -> ModuleOp:
+        with timing.measure("clone"):
+            module_op_llvm = self.module_op.clone()
+        lower_llvm_mut(module_op_llvm)
+        return module_op_llvm
+
+    @cached_property
+    def llvm_mlir(self) -> str:
+        def build() -> bytes:
+            if self.cache:  # reuses the lowered functions of earlier compilations
+                import incremental
+
+                return incremental.llvm_mlir(self.module_ast, self.module_op, self.cache).encode()
+            return str(self.module_op_llvm).encode()
+
+        return self._cached("llvm_mlir", build).decode()
+
+    @cached_property
+    def llvm_ir(self) -> str:
+        import llvm_exec
+
+        return self._cached("llvm_ir", lambda: llvm_exec.translate_llvm(self.llvm_mlir).encode(), llvm_exec.TOOLS[:2]).decode()
+
+    @cached_property
+    def llvm_obj(self) -> bytes:
+        import llvm_exec
+
+        return self._cached("llvm_obj", lambda: llvm_exec.compile_object(self.llvm_ir), llvm_exec.TOOLS[:3])
+
+    @cached_property
+    def llvm_exe(self) -> bytes:
+        import llvm_exec
+
+        return self._cached("llvm_exe", lambda: llvm_exec.link_executable(self.llvm_obj), llvm_exec.TOOLS)
+
+    @cached_property
+    def llvm_output(self) -> str:
+        import llvm_exec
+
+        llvm_exec_out, llvm_exec_err = llvm_exec.run_executable(self.llvm_exe)
+        assert not llvm_exec_err, f"llvm produced stderr: {llvm_exec_err}"
+        return llvm_exec_out
+
+    # b) aziz dialect -> lowered aziz mlir -> riscv dialect mlir -> riscv assembly codegen -> execute in qemu
+
+    @cached_property
+    def module_op_riscv(self) -> ModuleOp:
+        with timing.measure("clone"):
+            module_op_riscv = self.module_op.clone()
+        lower_aziz_mut(module_op_riscv)
+        lower_riscv_mut(module_op_riscv)
+        return module_op_riscv
+
+    @cached_property
+    def riscv_asm(self) -> str:
+        def build() -> bytes:
+            from rewrites.lower_riscv import format_assembly
+            from xdsl.dialects import riscv
+
+            if self.cache:  # reuses the lowered functions of earlier compilations
+                import incremental
+
+                return incremental.riscv_asm(self.module_ast, self.module_op, self.cache).encode()
+            io = StringIO()
+            riscv.print_assembly(self.module_op_riscv, io)
+            return format_assembly(io.getvalue()).encode()
+
+        return self._cached("riscv_asm", build).decode()
+
+    @cached_property
+    def riscv_elf(self) -> bytes:
+        import qemu
+
+        return self._cached("riscv_elf", lambda: qemu.assemble_riscv(self.riscv_asm), qemu.TOOLS[:2])
+
+    @cached_property
+    def emulator_output(self) -> str:
+        import qemu
+
+        elf = self.riscv_elf
+        with timing.measure("emulate"):
+            return qemu.emulate_elf(elf, entry_symbol="main")
+
+    @cached_property
+    def timing_report(self) -> str:
+        return self.recorder.report()
+
+    @cached_property
+    def memory_report(self) -> str:
+        return self.recorder.memory_report()
+
+    @cached_property
+    def timings(self) -> list[dict]:
+        return [asdict(m) for m in self.recorder.measurements]
+
+    @cached_property
+    def peak_memory(self) -> int:
+        # peak rss in bytes of this process and its finished children (backend workers, external tools)
+        import resource
+
+        return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) * 1024
+
+    # artifact cache
+
+    @cached_property
+    def _key_material(self) -> str | bytes:
+        # the source, without decoding it if it wasn't read as text
+        return self.src if "src" in self.__dict__ else self.file.read_bytes()
+
+    def _load(self, stage: str, tools: tuple[str, ...] = ()) -> bytes | None:
+        return self.cache.get(self.cache.key(self._key_material, tools), stage) if self.cache else None
+
+    def _store(self, stage: str, build: Callable[[], bytes], tools: tuple[str, ...] = ()) -> None:
+        if self.cache:
+            self.cache.put(self.cache.key(self._key_material, tools), stage, build())
+
+    def _cached(self, stage: str, build: Callable[[], bytes], tools: tuple[str, ...] = ()) -> bytes:
+        if (data := self._load(stage, tools)) is None:
+            data = build()
+            self._store(stage, lambda: data, tools)
+        return data
+
+
+def _run_stages(file: Path, src: str, stages: list[str], cache: ArtifactCache | None, timed: bool, memory: bool) -> tuple[dict[str, str], list[timing.Measurement]]:
+    # process pool entry point
+    pipeline = Pipeline(file, src, cache)
+    report = ["memory_report"] if memory else ["timing_report"] if timed else []
+    results = pipeline.run(stages + report)
+    for stage in report:
+        results.pop(stage)
+    return results, pipeline.recorder.measurements
+
+
+class PipelineError(Exception):
+    pass
+
+
+def run_batch(files: list[Path], stages: list[str], jobs: int | None = None, cache: ArtifactCache | None = None, parallel: bool = False, return_exceptions: bool = False) -> Iterator[tuple[Path, dict | PipelineError]]:
+    # compiles many files in a few warm processes, results come back in input order.
+    # with `return_exceptions` a failing file yields a `PipelineError` with its traceback instead of ending the batch.
+    if jobs == 1 or len(files) == 1:
+        yield from ((file, _run_file(file, stages, cache, parallel, return_exceptions)) for file in files)
+        return
+
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(files) // (4 * jobs))
+    with ProcessPoolExecutor(jobs, initializer=context) as pool:  # `context()` is built once per worker
+        yield from zip(files, pool.map(_run_file, files, repeat(stages), repeat(cache), repeat(False), repeat(return_exceptions), chunksize=chunksize))
+
+
+def _run_file(file: Path, stages: list[str], cache: ArtifactCache | None, parallel: bool = False, return_exceptions: bool = False) -> dict | PipelineError:
+    # process pool entry point. pool workers can't start the backend workers of `parallel` themselves.
+    try:
+        return Pipeline(file, cache=cache).run(stages, parallel=parallel)
+    except Exception:
+        if not return_exceptions:
+            raise
+        return PipelineError(traceback.format_exc())
+
+
+def optimize_aziz_mut(module_op: ModuleOp):
+    from rewrites.optimize import OptimizeAzizPass
+
+    apply_passes("optimize", module_op, [OptimizeAzizPass()])  # inline small functions, fold, drop dead functions
+
+
+def lower_aziz_mut(module_op: ModuleOp, optimize: bool = True, prefix: str = ""):
+    from rewrites.lower import LowerAzizPass
+    from rewrites.optimize import OptimizeAzizPass
+    from rewrites.tail_calls import EliminateTailCallsPass
+    from xdsl.transforms.canonicalize import CanonicalizePass
+    from xdsl.transforms.lower_affine import LowerAffinePass
+
+    apply_passes(
+        "lower-aziz",
+        module_op,
+        [
+            *([OptimizeAzizPass()] if optimize else [EliminateTailCallsPass(), CanonicalizePass()]),  # tail calls to loops, inline small functions, fold, drop dead functions
+            LowerAzizPass(prefix),  # lower to arith, func, scf, printf, llvm.global for strings
+            LowerAffinePass(),
+            CanonicalizePass(),  # automatically look up and apply canonicalization patterns for each op
+        ],
+    )
+
+
+def lower_llvm_mut(module_op: ModuleOp, remove_dead: bool = True, prefix: str = ""):
+    from rewrites.lower import LowerAzizPass
+    from rewrites.lower_llvm import LowerPrintfToLLVMCallPass
+    from rewrites.optimize import RemoveDeadFunctionsPass
+    from rewrites.tail_calls import EliminateTailCallsPass
+    from xdsl.transforms.canonicalize import CanonicalizePass
+    from xdsl.transforms.lower_affine import LowerAffinePass
+
+    apply_passes(
+        "lower-llvm",
+        module_op,
+        [
+            *([RemoveDeadFunctionsPass()] if remove_dead else []),  # functions not reachable from main
+            EliminateTailCallsPass(),  # self tail calls to loops, see `rewrites.tail_calls`
+            CanonicalizePass(),  # fold in the aziz dialect, see `rewrites.canonicalize`
+            LowerAzizPass(prefix),
+            LowerAffinePass(),
+            CanonicalizePass(),
+            LowerPrintfToLLVMCallPass(),
+        ],
+    )
+
+
+def lower_riscv_mut(module_op: ModuleOp, prefix: str = ""):
+    from rewrites.lower_riscv import AddPrintRuntimePass, AddRecursionSupportPass, CustomLowerScfToRiscvPass, EmitDataSectionPass, LowerPrintfPass, LowerSelectPass, MapToPhysicalRegistersPass, RemoveUnprintableOpsPass
+    from xdsl.backend.riscv.lowering.convert_arith_to_riscv import ConvertArithToRiscvPass
+    from xdsl.backend.riscv.lowering.convert_func_to_riscv_func import ConvertFuncToRiscvFuncPass
+    from xdsl.backend.riscv.lowering.convert_memref_to_riscv import ConvertMemRefToRiscvPass
+    from xdsl.backend.riscv.lowering.convert_riscv_scf_to_riscv_cf import ConvertRiscvScfToRiscvCfPass
+    from xdsl.transforms.dead_code_elimination import DeadCodeElimination
+    from xdsl.transforms.lower_riscv_func import LowerRISCVFunc
+    from xdsl.transforms.reconcile_unrealized_casts import ReconcileUnrealizedCastsPass
+    from xdsl.transforms.riscv_allocate_registers import RISCVAllocateRegistersPass
+
+    apply_passes(
+        "lower-riscv",
+        module_op,
+        [
+            LowerSelectPass(),  # arith.select missing from xdsl lib
+            RemoveUnprintableOpsPass(),  # handle llvm.global and llvm.address_of for strings
+            EmitDataSectionPass(),
+            AddPrintRuntimePass(),
+            ConvertFuncToRiscvFuncPass(),  # func -> riscv_func
+            AddRecursionSupportPass(),
+            CustomLowerScfToRiscvPass(prefix),  # replaces ConvertScfToRiscvPass
+            ConvertMemRefToRiscvPass(),  # memref -> riscv load/store
+            ConvertArithToRiscvPass(),  # arith -> riscv
+            LowerPrintfPass(),  # printf -> print runtime calls (after type conversion)
+            DeadCodeElimination(),  # dce
+            ReconcileUnrealizedCastsPass(),  # cleanup casts
+            RISCVAllocateRegistersPass(allow_infinite=True),  # virtual -> physical registers
+            MapToPhysicalRegistersPass(),
+            LowerRISCVFunc(insert_exit_syscall=True),  # riscv_func -> riscv labels and jumps
+            ConvertRiscvScfToRiscvCfPass(),
+        ],
+    )
+
+
+def apply_passes(pipeline: str, module_op: ModuleOp, passes: list[ModulePass]):
+    ctx = context()
+    for p in passes:
+        with timing.measure_pass(f"{pipeline}: {p.name}", module_op):
+            p.apply(ctx, module_op)
+    module_op.verify()
+
+
+# dialect name -> (module, attribute), only imported once an op of the dialect is parsed
+DIALECTS: dict[str, tuple[str, str]] = {
+    "aziz": ("dialects.aziz", "Aziz"),
+    "affine": ("xdsl.dialects.affine", "Affine"),
+    "arith": ("xdsl.dialects.arith", "Arith"),
+    "builtin": ("xdsl.dialects.builtin", "Builtin"),
+    "func": ("xdsl.dialects.func", "Func"),
+    "printf": ("xdsl.dialects.printf", "Printf"),
+    "riscv_func": ("xdsl.dialects.riscv_func", "RISCV_Func"),
+    "riscv_scf": ("xdsl.dialects.riscv_scf", "RISCV_Scf"),
+    "riscv": ("xdsl.dialects.riscv", "RISCV"),
+    "scf": ("xdsl.dialects.scf", "Scf"),
+}
+
+
+@lru_cache(None)
+def context() -> Context:
+    ctx = Context()
+    for name, (module, attr) in DIALECTS.items():
+        ctx.register_dialect(name, _dialect_loader(module, attr))
+    return ctx
+
+
+def _dialect_loader(module: str, attr: str) -> Callable[[], Dialect]:
+    return lambda: getattr(importlib.import_module(module), attr)
+
+
+def preload() -> None:
+    # eagerly import every backend and load every dialect, for long-running processes like the compile server
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    ctx = context()
+    loaded = {d.name for d in ctx.loaded_dialects}
+    for name in DIALECTS.keys() - loaded:
+        ctx.load_registered_dialect(name)
+
+
+# everything the stages and lowerings import on demand
+LAZY_MODULES = (
+    "incremental",
+    "interpreter",
+    "llvm_exec",
+    "qemu",
+    "rewrites.callgraph",
+    "rewrites.canonicalize",
+    "rewrites.lower",
+    "rewrites.lower_llvm",
+    "rewrites.lower_riscv",
+    "rewrites.optimize",
+    "rewrites.tail_calls",
+    "xdsl.backend.riscv.lowering.convert_arith_to_riscv",
+    "xdsl.backend.riscv.lowering.convert_func_to_riscv_func",
+    "xdsl.backend.riscv.lowering.convert_memref_to_riscv",
+    "xdsl.backend.riscv.lowering.convert_riscv_scf_to_riscv_cf",
+    "xdsl.interpreter",
+    "xdsl.parser",
+    "xdsl.transforms.canonicalize",
+    "xdsl.transforms.dead_code_elimination",
+    "xdsl.transforms.lower_affine",
+    "xdsl.transforms.lower_riscv_func",
+    "xdsl.transforms.reconcile_unrealized_casts",
+    "xdsl.transforms.riscv_allocate_registers",
+)
@@ -1,9 +1,9 @@
 import shutil
-import subprocess
 import tempfile
 from pathlib import Path
 
 from elftools.elf.elffile import ELFFile
+from timing import run_tool
 from unicorn import UC_ARCH_RISCV, UC_HOOK_CODE, UC_HOOK_MEM_WRITE, UC_MODE_RISCV64, Uc
 from unicorn.riscv_const import UC_RISCV_REG_A0, UC_RISCV_REG_A1, UC_RISCV_REG_A7, UC_RISCV_REG_MSTATUS, UC_RISCV_REG_SP, UC_RISCV_REG_T0, UC_RISCV_REG_T1, UC_RISCV_REG_T2
 
@@ -15,12 +15,13 @@ HALT_MAGIC_VALUE = 0x5555
 SYSCALL_EXIT = 93  # id for exit syscall in RISC-V linux ABI
 ECALL_INSTRUCTION = b"\x73\x00\x00\x00"
 MAX_INSTRUCTION_COUNT = 1_000_000  # livelock prevention
+TOOLS = ("riscv64-unknown-elf-as", "riscv64-unknown-elf-ld", "riscv64-unknown-elf-nm")
 
 
 def _assemble_and_link(asm_code: str, tmp: Path) -> Path:
     # assembly -> linking
     (tmp / "code.s").write_text(asm_code)
-    result = subprocess.run(["riscv64-unknown-elf-as", "-o", tmp / "code.o", tmp / "code.s"], capture_output=True, text=True)
+    result = run_tool(["riscv64-unknown-elf-as", "-o", tmp / "code.o", tmp / "code.s"], capture_output=True, text=True)
     assert result.returncode == 0, f"assembly error:\n{result.returncode=}\n{result.args=}\n{result.stdout=}\n{result.stderr=}"
 
     # linking -> ELF executable
@@ -33,18 +34,18 @@ def _assemble_and_link(asm_code: str, tmp: Path) -> Path:
     }}
     """
     (tmp / "link.ld").write_text(linker_script)
-    result = subprocess.run(["riscv64-unknown-elf-ld", "-T", tmp / "link.ld", "-o", tmp / "code.elf", tmp / "code.o"], capture_output=True, text=True)
+    result = run_tool(["riscv64-unknown-elf-ld", "-T", tmp / "link.ld", "-o", tmp / "code.elf", tmp / "code.o"], capture_output=True, text=True)
     assert result.returncode == 0, f"linking error:\n{result.returncode=}\n{result.args=}\n{result.stdout=}\n{result.stderr=}"
     return tmp / "code.elf"
 
 
 def _find_symbol_address(elf_path: Path, symbol_name: str) -> int:
     # locate mem address of a symbol in ELF (e.g. "main") executable
-    nm_output = subprocess.run(["riscv64-unknown-elf-nm", elf_path], capture_output=True, text=True, check=True).stdout
+    nm_output = run_tool(["riscv64-unknown-elf-nm", elf_path], capture_output=True, text=True, check=True).stdout
     assert nm_output
     nm_lines = nm_output.splitlines()
     parse_hex_addr = lambda line: int(line.split()[0], 16)
-    return next(parse_hex_addr(line) for line in nm_lines if symbol_name in line)
+    return next(parse_hex_addr(line) for line in nm_lines if line.split()[-1] == symbol_name)
 
 
 def _load_elf_segments(elf: ELFFile, emulator: Uc) -> None:
@@ -77,10 +78,19 @@ def _create_execution_hooks(emulator: Uc, output_buffer: list[str]) -> None:
 
 
 def emulate_riscv(asm_code: str, entry_symbol: str = "main") -> str:
+    return emulate_elf(assemble_riscv(asm_code), entry_symbol)
+
+
+def assemble_riscv(asm_code: str) -> bytes:
     assert shutil.which("riscv64-unknown-elf-as") and shutil.which("riscv64-unknown-elf-ld"), "compiler not found"
     with tempfile.TemporaryDirectory() as tmp_dir_str:
-        tmp_dir = Path(tmp_dir_str)
-        elf_path = _assemble_and_link(asm_code, tmp_dir)
+        return _assemble_and_link(asm_code, Path(tmp_dir_str)).read_bytes()
+
+
+def emulate_elf(elf: bytes, entry_symbol: str = "main") -> str:
+    with tempfile.TemporaryDirectory() as tmp_dir_str:
+        elf_path = Path(tmp_dir_str) / "code.elf"
+        elf_path.write_bytes(elf)
         entry_addr = _find_symbol_address(elf_path, entry_symbol)
 
         emulator = Uc(UC_ARCH_RISCV, UC_MODE_RISCV64)
@@ -0,0 +1,79 @@
+from typing import Iterable
+
+from dialects import aziz
+from xdsl.dialects.builtin import ModuleOp, StringAttr
+
+# the call graph of a module's functions, a snapshot: it isn't updated when calls are inlined or functions removed.
+#
+#   funcs     name -> function, in module order
+#   callees   name -> names of the functions it calls (calls of unknown functions left out, IRGen rejects them)
+#
+# its strongly connected components are the groups of mutually recursive functions. they come bottom-up, callees
+# before their callers, which is the order the inliner wants. the live functions are the ones reachable from the public
+# ones (main): private functions only run when called, so everything else is dead, including dead recursive cycles and
+# functions only called by dead ones.
+
+
+class CallGraph:
+    def __init__(self, module: ModuleOp):
+        self.funcs: dict[str, aziz.FuncOp] = {op.sym_name.data: op for op in module.body.block.ops if isinstance(op, aziz.FuncOp)}
+        self.callees: dict[str, set[str]] = {name: {c.callee.string_value() for c in op.walk() if isinstance(c, aziz.CallOp)} & self.funcs.keys() for name, op in self.funcs.items()}
+
+    def sccs(self) -> list[list[str]]:
+        # tarjan's algorithm with an explicit stack, recursion would overflow on long call chains. a component is
+        # finished after all components it reaches, so they come out bottom-up
+        index: dict[str, int] = {}
+        low: dict[str, int] = {}
+        stack: list[str] = []
+        on_stack: set[str] = set()
+        components: list[list[str]] = []
+
+        for root in self.funcs:
+            if root in index:
+                continue
+            work = [(root, iter(sorted(self.callees[root])))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                name, callees = work[-1]
+                if (callee := next(callees, None)) is not None:
+                    if callee not in index:
+                        index[callee] = low[callee] = len(index)
+                        stack.append(callee)
+                        on_stack.add(callee)
+                        work.append((callee, iter(sorted(self.callees[callee]))))
+                    elif callee in on_stack:
+                        low[name] = min(low[name], index[callee])
+                    continue
+
+                work.pop()
+                if work:
+                    caller = work[-1][0]
+                    low[caller] = min(low[caller], low[name])
+                if low[name] == index[name]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == name:
+                            break
+                    components.append(component[::-1])
+        return components
+
+    def recursive(self) -> set[str]:
+        # functions that can reach themselves: members of cycles and self-callers
+        return {name for component in self.sccs() for name in component if len(component) > 1 or name in self.callees[name]}
+
+    def reachable(self, roots: Iterable[str]) -> set[str]:
+        seen = set(roots)
+        stack = list(seen)
+        while stack:
+            for callee in self.callees[stack.pop()] - seen:
+                seen.add(callee)
+                stack.append(callee)
+        return seen
+
+    def live(self) -> set[str]:
+        return self.reachable(name for name, op in self.funcs.items() if op.sym_visibility != StringAttr("private"))
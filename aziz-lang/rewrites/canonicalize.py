@@ -0,0 +1,118 @@
+import math
+import operator
+
+from dialects import aziz
+from xdsl.dialects.builtin import IntegerType
+from xdsl.ir import Attribute, SSAValue
+from xdsl.pattern_rewriter import PatternRewriter, RewritePattern, op_type_rewrite_pattern
+from xdsl.rewriter import InsertPoint
+
+# canonicalization patterns of the aziz arithmetic ops, registered through their traits (see `dialects.aziz`), so they
+# run wherever `CanonicalizePass` or `OptimizeAzizPass` runs.
+#
+#   (+ 100 200)        ─> 300                 constant operands
+#   (+ 1 x)            ─> (+ x 1)             constants to the right of + and *
+#   (+ x 0), (* x 1)   ─> x                   identities
+#   (+ (+ x 1) 2)      ─> (+ x 3)             constant chains reassociated
+#   (if 1 a b)         ─> a                   constant conditions
+#
+# integers fold like the backends compute them, wrapping around at their width. floats are only simplified where
+# that is exact for every value: x + 0.0 isn't x for x = -0.0, x * 0.0 isn't 0.0 for inf and nan, and so on.
+
+BINARY = {aziz.AddOp: operator.add, aziz.SubOp: operator.sub, aziz.MulOp: operator.mul}
+
+
+def _constant(value: SSAValue) -> int | float | None:
+    return value.owner.value.value.data if isinstance(value.owner, aziz.ConstantOp) else None
+
+
+def wrap(value: int | float, type: Attribute) -> int | float:
+    # what the backends compute for `value` of `type`, also used by the interpreter
+    if isinstance(type, IntegerType):
+        width = type.width.data
+        return (value + 2 ** (width - 1)) % 2**width - 2 ** (width - 1)
+    return value
+
+
+class FoldConstantOperands(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.AddOp | aziz.SubOp | aziz.MulOp | aziz.LessThanEqualOp, rewriter: PatternRewriter):
+        lhs, rhs = _constant(op.lhs), _constant(op.rhs)
+        if lhs is None or rhs is None:
+            return
+
+        if isinstance(op, aziz.LessThanEqualOp):
+            rewriter.replace_op(op, aziz.ConstantOp(int(lhs <= rhs)))
+        else:
+            rewriter.replace_op(op, aziz.ConstantOp(wrap(BINARY[type(op)](lhs, rhs), op.res.type)))
+
+
+class FoldConstantCast(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.CastIntToFloatOp, rewriter: PatternRewriter):
+        if (value := _constant(op.input)) is not None:
+            rewriter.replace_op(op, aziz.ConstantOp(float(value)))
+
+
+class ConstantsToTheRight(RewritePattern):
+    # so the other patterns only need to look at the right operand
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.AddOp | aziz.MulOp, rewriter: PatternRewriter):
+        if _constant(op.lhs) is not None and _constant(op.rhs) is None:
+            rewriter.replace_op(op, type(op)(op.rhs, op.lhs))
+
+
+class SimplifyIdentities(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.AddOp | aziz.SubOp | aziz.MulOp | aziz.LessThanEqualOp, rewriter: PatternRewriter):
+        is_int = isinstance(op.lhs.type, IntegerType)
+        rhs = _constant(op.rhs)
+        is_positive_zero = rhs == 0 and (is_int or math.copysign(1.0, rhs) > 0)
+
+        match op:
+            case aziz.AddOp() if is_int and rhs == 0:
+                rewriter.replace_op(op, [], [op.lhs])
+            case aziz.SubOp() if is_positive_zero:
+                rewriter.replace_op(op, [], [op.lhs])
+            case aziz.MulOp() if rhs == 1:
+                rewriter.replace_op(op, [], [op.lhs])
+            case aziz.MulOp() if is_int and rhs == 0:
+                rewriter.replace_op(op, [], [op.rhs])
+            case aziz.SubOp() if is_int and op.lhs == op.rhs:
+                rewriter.replace_op(op, aziz.ConstantOp(0))
+            case aziz.LessThanEqualOp() if is_int and op.lhs == op.rhs:
+                rewriter.replace_op(op, aziz.ConstantOp(1))
+
+
+class ReassociateConstants(RewritePattern):
+    # integers only, float arithmetic isn't associative. + and - chains become one + of their summed constants
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.AddOp | aziz.SubOp | aziz.MulOp, rewriter: PatternRewriter):
+        inner = op.lhs.owner
+        outer_const, inner_const = _constant(op.rhs), _constant(inner.rhs) if isinstance(inner, tuple(BINARY)) else None
+        if not isinstance(op.res.type, IntegerType) or outer_const is None or inner_const is None:
+            return
+
+        is_sum = lambda o: isinstance(o, (aziz.AddOp, aziz.SubOp))
+        signed = lambda o, c: -c if isinstance(o, aziz.SubOp) else c
+        if is_sum(op) and is_sum(inner):
+            const = aziz.ConstantOp(wrap(signed(inner, inner_const) + signed(op, outer_const), op.res.type))
+            rewriter.replace_op(op, [const, aziz.AddOp(inner.lhs, const.res)])
+        elif isinstance(op, aziz.MulOp) and isinstance(inner, aziz.MulOp):
+            const = aziz.ConstantOp(wrap(inner_const * outer_const, op.res.type))
+            rewriter.replace_op(op, [const, aziz.MulOp(inner.lhs, const.res)])
+
+
+class FoldConstantCondition(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.IfOp, rewriter: PatternRewriter):
+        if (cond := _constant(op.cond)) is None:
+            return
+
+        block = (op.then_region if cond else op.else_region).block
+        yield_op = block.last_op
+        assert isinstance(yield_op, aziz.YieldOp)
+        values = list(yield_op.inputs)
+        rewriter.erase_op(yield_op)
+        rewriter.inline_block(block, InsertPoint.before(op))
+        rewriter.replace_op(op, [], values)
@@ -1,8 +1,10 @@
+from dataclasses import dataclass
+
 from dialects import aziz
 from xdsl.context import Context
 from xdsl.dialects import arith, func, llvm, printf, scf
 from xdsl.dialects.builtin import AnyFloat, ArrayAttr, FloatAttr, IntegerAttr, IntegerType, ModuleOp, StringAttr, i8
-from xdsl.ir import Block
+from xdsl.ir import Block, Region
 from xdsl.passes import ModulePass
 from xdsl.pattern_rewriter import GreedyRewritePatternApplier, PatternRewriter, PatternRewriteWalker, RewritePattern, op_type_rewrite_pattern
 from xdsl.rewriter import InsertPoint
@@ -93,10 +95,43 @@ class IfOpLowering(RewritePattern):
         then_region = rewriter.move_region_contents_to_new_regions(op.then_region)
         else_region = rewriter.move_region_contents_to_new_regions(op.else_region)
 
-        new_op = scf.IfOp(cond, [r.type for r in op.results], then_region, else_region)
+        convert_type = lambda t: llvm.LLVMPointerType() if isinstance(t, aziz.StringType) else t  # strings become pointers
+        new_op = scf.IfOp(cond, [convert_type(r.type) for r in op.results], then_region, else_region)
         rewriter.replace_op(op, new_op)
 
 
+class LoopOpLowering(RewritePattern):
+    # the body is the before region of an scf.while, its loop condition becomes the scf.condition. the after region
+    # passes the arguments for the next iteration back
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: aziz.LoopOp, rewriter: PatternRewriter):  # strings become pointers
+        convert_type = lambda t: llvm.LLVMPointerType() if isinstance(t, aziz.StringType) else t
+
+        # the body with the converted argument types
+        body = op.body.block
+        before_block = Block(arg_types=[convert_type(t) for t in body.arg_types])
+        for old_arg, new_arg in zip(body.args, before_block.args):
+            old_arg.replace_by(new_arg)
+        for o in list(body.ops):
+            o.detach()
+            before_block.add_op(o)
+        before_region = Region(before_block)
+        condition = before_block.last_op
+        assert isinstance(condition, aziz.LoopConditionOp)
+
+        types = [convert_type(t) for t in condition.values.types]
+        zero = arith.ConstantOp(IntegerAttr(0, condition.cond.type))
+        cmp = arith.CmpiOp(condition.cond, zero.result, "ne")  # condition != 0
+        rewriter.insert_op([zero, cmp], InsertPoint.before(condition))
+        rewriter.replace_op(condition, scf.ConditionOp(cmp.result, *condition.values))
+
+        after_block = Block(arg_types=types)
+        after_block.add_op(scf.YieldOp(*after_block.args[: len(op.inits)]))
+
+        new_op = scf.WhileOp(op.inits, types, before_region, Region(after_block))
+        rewriter.replace_op(op, new_op, new_op.res[len(op.inits) :])
+
+
 #
 # func
 #
@@ -162,7 +197,7 @@ class CallOpLowering(RewritePattern):
 class YieldOpLowering(RewritePattern):
     @op_type_rewrite_pattern
     def match_and_rewrite(self, op: aziz.YieldOp, rewriter: PatternRewriter):
-        rewriter.replace_op(op, scf.YieldOp(op.input))
+        rewriter.replace_op(op, scf.YieldOp(*op.inputs))
 
 
 #
@@ -187,10 +222,11 @@ class PrintOpLowering(RewritePattern):
 
 
 class StringConstantOpLowering(RewritePattern):
-    def __init__(self):
+    def __init__(self, prefix: str = ""):
         super().__init__()
         self._string_cache: dict[str, str] = {}  # string content -> global name
         self._counter: int = 0
+        self._prefix = prefix  # keeps the globals of separately lowered functions apart
 
     @op_type_rewrite_pattern
     def match_and_rewrite(self, op: aziz.StringConstantOp, rewriter: PatternRewriter):
@@ -219,7 +255,7 @@ class StringConstantOpLowering(RewritePattern):
         return module
 
     def _create_global_for_string(self, string_content: str, encoded_val: bytes, module: ModuleOp, rewriter: PatternRewriter) -> None:
-        global_name = f".aziz.str.{self._counter}"
+        global_name = f".aziz.str.{self._prefix}{self._counter}"
         self._counter += 1
         self._string_cache[string_content] = global_name
 
@@ -231,9 +267,12 @@ class StringConstantOpLowering(RewritePattern):
         rewriter.insert_op(global_op, InsertPoint.at_start(module.body.blocks[0]))
 
 
+@dataclass(frozen=True)
 class LowerAzizPass(ModulePass):
     name = "lower-aziz"
 
+    string_prefix: str = ""
+
     def apply(self, _: Context, op: ModuleOp) -> None:
         PatternRewriteWalker(
             GreedyRewritePatternApplier(
@@ -248,8 +287,9 @@ class LowerAzizPass(ModulePass):
                     FuncOpLowering(),
                     CallOpLowering(),
                     IfOpLowering(),
+                    LoopOpLowering(),
                     YieldOpLowering(),
-                    StringConstantOpLowering(),
+                    StringConstantOpLowering(self.string_prefix),
                     PrintOpLowering(),
                 ]
             )
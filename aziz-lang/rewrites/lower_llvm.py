@@ -1,3 +1,4 @@
+from symbols import SymbolIndex
 from xdsl.context import Context
 from xdsl.dialects import arith, builtin, llvm, printf
 from xdsl.dialects.builtin import ModuleOp, StringAttr, SymbolRefAttr
@@ -95,11 +96,10 @@ class PrintFormatOpLowering(RewritePattern):
 
     def _ensure_global_string_constant(self, module: ModuleOp, content: str, name_hint: str) -> llvm.GlobalOp:
         sym_name = f"__str_{name_hint}"
-        module_block = module.body.blocks[0]
+        symbols = SymbolIndex.of(module)
 
-        for op in module_block.ops:
-            if isinstance(op, llvm.GlobalOp) and op.sym_name.data == sym_name:
-                return op
+        if isinstance(existing := symbols.lookup(sym_name), llvm.GlobalOp):
+            return existing
 
         # doesn't exist, create new global string constant
         data_bytes = content.encode("utf-8") + b"\0"
@@ -107,13 +107,7 @@ class PrintFormatOpLowering(RewritePattern):
         val_attr = builtin.ArrayAttr([builtin.IntegerAttr(b, builtin.i8) for b in data_bytes])
         global_op = llvm.GlobalOp(arr_type, StringAttr(sym_name), linkage=llvm.LinkageAttr("internal"), constant=True, value=val_attr)
 
-        # insert at top of module
-        if module_block.ops:
-            module_block.insert_op_before(global_op, module_block.first_op)
-        else:
-            module_block.add_op(global_op)
-
-        return global_op
+        return symbols.add(global_op, at_start=True)
 
 
 class LowerPrintfToLLVMCallPass(ModulePass):
@@ -127,12 +121,11 @@ class LowerPrintfToLLVMCallPass(ModulePass):
         # we need to declare `printf` so we can call it.
         # declare external i32 @printf(i8*, ...)
 
-        module_block = module.body.blocks[0]
+        symbols = SymbolIndex.of(module)
 
         # check if already exists
-        for op in module_block.ops:
-            if hasattr(op, "sym_name") and op.sym_name.data == "printf":
-                return
+        if symbols.lookup("printf") is not None:
+            return
 
         ptr_type = llvm.LLVMPointerType()
         i32_type = builtin.i32
@@ -141,4 +134,4 @@ class LowerPrintfToLLVMCallPass(ModulePass):
 
         printf_decl = llvm.FuncOp("printf", printf_sig, linkage=llvm.LinkageAttr("external"))
 
-        module_block.add_op(printf_decl)
+        symbols.add(printf_decl)
@@ -1,15 +1,16 @@
+from dataclasses import dataclass
 from functools import lru_cache
-from typing import Callable
+from typing import Callable, Sequence
 
 from qemu import STDOUT_ADDR
 from xdsl.context import Context
 from xdsl.dialects import arith, func, llvm, printf, riscv, riscv_func, scf
-from xdsl.dialects.builtin import ArrayAttr, IntegerAttr, ModuleOp, StringAttr, SymbolRefAttr, UnrealizedConversionCastOp
+from xdsl.dialects.builtin import ArrayAttr, Float64Type, IntegerAttr, ModuleOp, StringAttr, SymbolRefAttr, UnrealizedConversionCastOp
 from xdsl.ir import Attribute, Block, Operation, Region, SSAValue
 from xdsl.irdl import attr_def, base, irdl_op_definition, result_def
 from xdsl.passes import ModulePass
-from xdsl.pattern_rewriter import PatternRewriter, PatternRewriteWalker, RewritePattern, op_type_rewrite_pattern
-from xdsl.rewriter import InsertPoint
+from xdsl.pattern_rewriter import GreedyRewritePatternApplier, PatternRewriter, PatternRewriteWalker, RewritePattern, op_type_rewrite_pattern
+from xdsl.rewriter import InsertPoint, Rewriter
 
 #
 # custom risc-v assembly ops (used later in lowering)
@@ -79,6 +80,24 @@ class RISCVLabelOp(riscv.RISCVAsmOperation):
         return f"{self.label.data}:"
 
 
+@irdl_op_definition
+class RISCVSdOp(riscv.RsRsImmIntegerOperation):
+    # 64-bit store, missing from xdsl lib like ld: sd rs2, imm(rs1)
+    name = "riscv.sd"
+
+    def assembly_line(self):
+        return f"sd {self.rs2.type.register_name.data}, {self.immediate.value.data}({self.rs1.type.register_name.data})"
+
+
+@irdl_op_definition
+class RISCVLdOp(riscv.RdRsImmIntegerOperation):
+    # 64-bit load: ld rd, imm(rs1)
+    name = "riscv.ld"
+
+    def assembly_line(self):
+        return f"ld {self.rd.type.register_name.data}, {self.immediate.value.data}({self.rs1.type.register_name.data})"
+
+
 #
 # arith.SelectOp lowering
 #
@@ -149,8 +168,10 @@ class RemoveUnprintableOpsPass(ModulePass):
         # llvm.addressof -> riscv.la opss
         for a in [o for o in op.walk() if isinstance(o, llvm.AddressOfOp)]:
             la = RISCVLaOp(a.global_name.root_reference.data, riscv.IntRegisterType.unallocated())
+            ptr = UnrealizedConversionCastOp.create(operands=[la.rd], result_types=[a.results[0].type])  # still a pointer to the ops using it
             a.parent_block().insert_op_before(la, a)
-            a.results[0].replace_by(la.rd)
+            a.parent_block().insert_op_before(ptr, a)
+            a.results[0].replace_by(ptr.results[0])
             a.detach()
 
 
@@ -200,7 +221,8 @@ class LowerPrintfPass(ModulePass):
         # printf.PrintFormatOp -> calls to one of the _print_* runtime functions
         for p in [o for o in op.walk() if isinstance(o, printf.PrintFormatOp) if o.operands]:
             val, cast = unwrap_cast(p.operands[0])
-            is_lbl = isinstance(getattr(val.owner, "label", None), riscv.LabelAttr) or isinstance(getattr(val.owner, "immediate", None), riscv.LabelAttr)
+            is_ptr = isinstance(p.operands[0].type, llvm.LLVMPointerType)  # strings passed around, not only literals
+            is_lbl = is_ptr or isinstance(getattr(val.owner, "label", None), riscv.LabelAttr) or isinstance(getattr(val.owner, "immediate", None), riscv.LabelAttr)
             is_int = isinstance(val.type, riscv.IntRegisterType)
             is_flt = isinstance(val.type, riscv.FloatRegisterType)
 
@@ -211,9 +233,9 @@ class LowerPrintfPass(ModulePass):
             elif is_flt:
                 self._emit(p, val, "_print_float", True)
 
-            p.detach()
-            if cast:
-                cast.detach()
+            Rewriter.erase_op(p)
+            if cast and not cast.results[0].uses:  # the printed value may be used after printing it
+                Rewriter.erase_op(cast)
 
     def _emit(self, op: printf.PrintFormatOp, arg: SSAValue, fn: str, is_float: bool) -> None:
         # before:
@@ -410,7 +432,7 @@ class AddRecursionSupportPass(ModulePass):
     def apply(self, ctx: Context, op: ModuleOp) -> None:
         skip = {"main", "_start", "_print_string", "_print_int", "_print_float"}
 
-        user_functions = [f for f in op.walk() if isinstance(f, riscv_func.FuncOp) and f.sym_name.data not in skip]
+        user_functions = [f for f in op.walk() if isinstance(f, riscv_func.FuncOp) and f.sym_name.data not in skip and f.body.blocks]  # not declarations
         for f in user_functions:
             self._prologue(f.body.blocks[0])
 
@@ -450,15 +472,37 @@ class AddRecursionSupportPass(ModulePass):
 #
 
 
+def store_slot(sp: SSAValue, value: SSAValue, offset: int) -> list[Operation]:
+    # stack slots are 8 bytes: doubles go through float registers, pointers need all 64 bits, i32 only the low half
+    if isinstance(value.type, Float64Type):
+        vc = UnrealizedConversionCastOp.create(operands=[value], result_types=[riscv.FloatRegisterType.unallocated()])
+        return [vc, riscv.FSdOp(sp, vc.results[0], offset)]
+    vc = UnrealizedConversionCastOp.create(operands=[value], result_types=[riscv.IntRegisterType.unallocated()])
+    return [vc, (RISCVSdOp if isinstance(value.type, llvm.LLVMPointerType) else riscv.SwOp)(sp, vc.results[0], offset)]
+
+
+def load_slot(sp: SSAValue, offset: int, type: Attribute) -> list[Operation]:
+    # the counterpart of `store_slot`, the last op's result is the loaded value of `type`
+    if isinstance(type, Float64Type):
+        load = riscv.FLdOp(sp, offset, rd=riscv.FloatRegisterType.unallocated())
+    else:
+        load = (RISCVLdOp if isinstance(type, llvm.LLVMPointerType) else riscv.LwOp)(sp, offset, rd=riscv.IntRegisterType.unallocated())
+    return [load, UnrealizedConversionCastOp.create(operands=[load.rd], result_types=[type])]
+
+
 class CustomScfIfToRiscvLowering(RewritePattern):
     label_cnt = 0
 
+    def __init__(self, label_prefix: str = ""):
+        super().__init__()
+        self.label_prefix = label_prefix  # keeps the labels of separately lowered functions apart
+
     @op_type_rewrite_pattern
     def match_and_rewrite(self, op: scf.IfOp, rewriter: PatternRewriter):
         # unique labels for else-branch and continuation-point
         self.label_cnt += 1
-        lbl_else = f"else_{self.label_cnt}"
-        lbl_cont = f"cont_{self.label_cnt}"
+        lbl_else = f"{self.label_prefix}else_{self.label_cnt}"
+        lbl_cont = f"{self.label_prefix}cont_{self.label_cnt}"
         rtype = riscv.IntRegisterType.unallocated()
 
         # pass condition to register
@@ -469,11 +513,11 @@ class CustomScfIfToRiscvLowering(RewritePattern):
 
         # scf.IfOp is expressed as a function with scf.YieldOps for results / return values.
         # for each result, allocate 8 bytes on stack to store it.
-        res_ptrs = []
-        for _ in op.results:
-            rewriter.insert_op(RISCVDirectiveOp("addi", "sp, sp, -8"), InsertPoint.before(op))
-            res_ptrs.append(riscv.GetRegisterOp(riscv.Registers.SP))
-            rewriter.insert_op(res_ptrs[-1], InsertPoint.before(op))
+        size = 8 * len(op.results)
+        if size:
+            rewriter.insert_op(RISCVDirectiveOp("addi", f"sp, sp, -{size}"), InsertPoint.before(op))
+        sp = riscv.GetRegisterOp(riscv.Registers.SP)
+        rewriter.insert_op(sp, InsertPoint.before(op))
 
         def emit_branch(region: Region, jump_to: str | None = None):
             if not region.block:
@@ -483,9 +527,7 @@ class CustomScfIfToRiscvLowering(RewritePattern):
                 if isinstance(o, scf.YieldOp):
                     # store returned values to stack
                     for i, val in enumerate(o.operands):
-                        vc = UnrealizedConversionCastOp.create(operands=[val], result_types=[rtype])
-                        rewriter.insert_op(vc, InsertPoint.before(op))
-                        rewriter.insert_op(riscv.SwOp(res_ptrs[i].res, vc.results[0], 0), InsertPoint.before(op))
+                        rewriter.insert_op(store_slot(sp.res, val, 8 * i), InsertPoint.before(op))
                 else:
                     # keep as is
                     o.detach()
@@ -504,22 +546,108 @@ class CustomScfIfToRiscvLowering(RewritePattern):
 
         # load results from stack
         finals = []
-        for i, ptr in enumerate(res_ptrs):
-            load = riscv.LwOp(ptr.res, 0, rd=rtype)
+        for i, res in enumerate(op.results):
+            load = load_slot(sp.res, 8 * i, res.type)
             rewriter.insert_op(load, InsertPoint.before(op))
-            cast_back = UnrealizedConversionCastOp.create(operands=[load.rd], result_types=[op.results[i].type])
-            rewriter.insert_op(cast_back, InsertPoint.before(op))
-            finals.append(cast_back.results[0])
-            rewriter.insert_op(RISCVDirectiveOp("addi", "sp, sp, 8"), InsertPoint.before(op))
+            finals.append(load[-1].results[0])
+        if size:
+            rewriter.insert_op(RISCVDirectiveOp("addi", f"sp, sp, {size}"), InsertPoint.before(op))
 
         rewriter.replace_op(op, [], finals)
 
 
+#
+# scf.WhileOp lowering
+#
+
+
+class CustomScfWhileToRiscvLowering(RewritePattern):
+    # the loop-carried values live in stack slots, not registers: the register allocator sees the flattened loop as
+    # straight-line code and would reuse registers across the jump back to the head. the body of an aziz.loop only
+    # uses its arguments (see `dialects.aziz.LoopOp`), so nothing else is carried
+    #
+    #       addi sp, sp, -8n       store the initial values
+    #   head:
+    #       <before region>        load the values, compute the condition and the forwarded values
+    #       beq cond, zero, exit
+    #       <after region>         store the next values
+    #       j head
+    #   exit:
+    #       addi sp, sp, 8n        results are the forwarded values
+
+    label_cnt = 0
+
+    def __init__(self, label_prefix: str = ""):
+        super().__init__()
+        self.label_prefix = label_prefix
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: scf.WhileOp, rewriter: PatternRewriter):
+        self.label_cnt += 1
+        lbl_head = f"{self.label_prefix}loop_{self.label_cnt}"
+        lbl_exit = f"{self.label_prefix}loop_exit_{self.label_cnt}"
+        rtype = riscv.IntRegisterType.unallocated()
+        size = 8 * len(op.arguments)
+        insert = lambda o: rewriter.insert_op(o, InsertPoint.before(op))
+
+        def store(values: Sequence[SSAValue]):
+            sp = riscv.GetRegisterOp(riscv.Registers.SP)
+            insert(sp)
+            for i, val in enumerate(values):
+                insert(store_slot(sp.res, val, 8 * i))
+
+        def emit_block(block: Block):
+            for o in list(block.ops)[:-1]:
+                o.detach()
+                insert(o)
+
+        if size:
+            insert(RISCVDirectiveOp("addi", f"sp, sp, -{size}"))
+        store(op.arguments)
+        insert(RISCVLabelOp(lbl_head))
+
+        # load the loop-carried values into the before region's arguments
+        before, after = op.before_region.block, op.after_region.block
+        sp = riscv.GetRegisterOp(riscv.Registers.SP)
+        insert(sp)
+        for i, arg in enumerate(before.args):
+            load = load_slot(sp.res, 8 * i, arg.type)
+            insert(load)
+            arg.replace_by(load[-1].results[0])
+        emit_block(before)
+
+        # leave the loop if the condition is false, otherwise continue in the after region
+        condition = before.last_op
+        assert isinstance(condition, scf.ConditionOp)
+        reg_cond = UnrealizedConversionCastOp.create(operands=[condition.condition], result_types=[rtype])
+        zero = riscv.GetRegisterOp(riscv.Registers.ZERO)
+        insert(reg_cond)
+        insert(zero)
+        insert(riscv.BeqOp(reg_cond.results[0], zero.res, offset=riscv.LabelAttr(lbl_exit)))
+
+        for arg, val in zip(after.args, condition.args):
+            arg.replace_by(val)
+        emit_block(after)
+        yield_op = after.last_op
+        assert isinstance(yield_op, scf.YieldOp)
+        store(yield_op.operands)
+        insert(RISCVDirectiveOp("j", lbl_head))
+
+        insert(RISCVLabelOp(lbl_exit))
+        if size:
+            insert(RISCVDirectiveOp("addi", f"sp, sp, {size}"))
+        rewriter.replace_op(op, [], list(condition.args))
+
+
+@dataclass(frozen=True)
 class CustomLowerScfToRiscvPass(ModulePass):
     name = "custom-lower-scf-to-riscv"
 
+    label_prefix: str = ""
+
     def apply(self, ctx: Context, op: ModuleOp):
-        PatternRewriteWalker(CustomScfIfToRiscvLowering()).rewrite_module(op)
+        patterns = [CustomScfIfToRiscvLowering(self.label_prefix), CustomScfWhileToRiscvLowering(self.label_prefix)]
+        PatternRewriteWalker(GreedyRewritePatternApplier(patterns)).rewrite_module(op)
 
 
 #
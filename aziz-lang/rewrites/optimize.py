@@ -1,77 +1,123 @@
+from collections import Counter, deque
+from dataclasses import dataclass
+
 from dialects import aziz
+from rewrites.callgraph import CallGraph
+from rewrites.tail_calls import EliminateTailCallsPass
 from xdsl.context import Context
 from xdsl.dialects.builtin import ModuleOp, StringAttr
 from xdsl.passes import ModulePass
-from xdsl.pattern_rewriter import PatternRewriter, PatternRewriteWalker, RewritePattern, op_type_rewrite_pattern
-from xdsl.rewriter import InsertPoint
-from xdsl.traits import CallableOpInterface, SymbolTable
-from xdsl.transforms.dead_code_elimination import dce
-
-
-class InlineFunctions(RewritePattern):
-    @op_type_rewrite_pattern
-    def match_and_rewrite(self, op: aziz.CallOp, rewriter: PatternRewriter):
-        callee = SymbolTable.lookup_symbol(op, op.callee)
-
-        is_unknown = callee is None
-        if is_unknown:
-            return
-
-        is_self_call = lambda op: isinstance(op, aziz.CallOp) and op.callee.string_value() == callee.sym_name.data
-        is_recursive = any(is_self_call(child_op) for child_op in callee.walk())
-        if is_recursive:
-            return
-
-        callable_interface = callee.get_trait(CallableOpInterface)
-        not_callable = callable_interface is None
-        if not_callable:
-            return
-
-        # just inline one-liner functions for simplicity
-        impl_body = callable_interface.get_callable_region(callee)
-        is_one_liner = len(impl_body.blocks) == 1  # just inline on
-        if not is_one_liner:
-            return
-
-        impl_block = impl_body.clone().block
-        assert len(op.operands) == len(impl_block.args), f"arity mismatch in inlining {op} and {callee}"
-
-        for operand, arg in zip(op.operands, impl_block.args):
-            arg.replace_by(operand)
+from xdsl.pattern_rewriter import GreedyRewritePatternApplier, PatternRewriteWalker
+from xdsl.rewriter import InsertPoint, Rewriter
+from xdsl.transforms.canonicalize import CanonicalizationRewritePattern
+from xdsl.transforms.dead_code_elimination import RemoveUnusedOperations, dce
+
+
+# bottom-up inliner with a cost model. functions are visited callees first (see `callgraph`), so a callee is already
+# as small as inlining and folding make it when its callers decide about it. a call is inlined if
+#
+#   - the callee isn't recursive (in a call cycle, or calling itself), and
+#   - the callee is no larger than what the call costs: the call overhead plus a bonus per constant argument, which
+#     folding will likely propagate. or it is the only call of a private callee, which is dropped afterwards, and
+#   - the caller stays within its growth budget. inlining the only call of a function doesn't grow the program, so
+#     it doesn't count against it.
+#
+# calls brought in by inlining are considered too. sizes are op counts, budgets are per caller so a function's code
+# only depends on the functions it reaches (see `incremental`).
+
+CALL_OVERHEAD = 30  # ops worth of a call: the riscv frame saves and restores 13 registers (104 bytes), plus jumps
+CONSTANT_ARGUMENT_BONUS = 5
+MAX_GROWTH = 2  # times its own size a caller may grow to
+MIN_BUDGET = 64  # ops any caller may grow by
+
+
+@dataclass(slots=True)
+class InlineDecision:
+    caller: str
+    callee: str
+    callee_size: int
+    benefit: int
+    reason: str  # "small", "only call" if inlined, "recursive", "too large", "over budget" otherwise
+
+    @property
+    def inlined(self) -> bool:
+        return self.reason in ("small", "only call")
+
+
+def inline_calls(module: ModuleOp) -> list[InlineDecision]:
+    # inlines in place, functions are canonicalized once their calls are decided
+    graph = CallGraph(module)
+    recursive = graph.recursive()
+    uses = Counter(op.callee.string_value() for op in module.walk() if isinstance(op, aziz.CallOp))
+    canonicalize = PatternRewriteWalker(GreedyRewritePatternApplier([RemoveUnusedOperations(), CanonicalizationRewritePattern()]))
+
+    decisions: list[InlineDecision] = []
+    for name in (name for component in graph.sccs() for name in component):
+        func_op = graph.funcs[name]
+        size = _size(func_op)
+        budget = max((MAX_GROWTH - 1) * size, MIN_BUDGET)  # ops left to grow by
+
+        work = deque(op for op in func_op.walk() if isinstance(op, aziz.CallOp))
+        while work:
+            call = work.popleft()
+            callee_name = call.callee.string_value()
+            callee = graph.funcs[callee_name]
+            callee_size = _size(callee)
+            benefit = CALL_OVERHEAD + CONSTANT_ARGUMENT_BONUS * sum(isinstance(arg.owner, aziz.ConstantOp) for arg in call.arguments)
+            is_only_call = uses[callee_name] == 1 and callee.sym_visibility == StringAttr("private")
+
+            if callee_name in recursive:
+                reason = "recursive"
+            elif callee_size > benefit and not is_only_call:
+                reason = "too large"
+            elif not is_only_call and callee_size - 1 > budget:
+                reason = "over budget"
+            else:
+                reason = "only call" if is_only_call else "small"
+                budget -= 0 if is_only_call else callee_size - 1
+                new_calls = _inline(call, callee)
+                uses[callee_name] -= 1
+                uses.update(op.callee.string_value() for op in new_calls)
+                work.extend(new_calls)
+            decisions.append(InlineDecision(name, callee_name, callee_size, benefit, reason))
+
+        canonicalize.rewrite_region(func_op.body)
+    return decisions
+
+
+def _inline(call: aziz.CallOp, callee: aziz.FuncOp) -> list[aziz.CallOp]:
+    # replaces `call` by a copy of the body of `callee`, returns the calls in the copy
+    block = callee.body.clone().block
+    calls = [op for op in block.walk() if isinstance(op, aziz.CallOp)]
+    return_op = block.last_op
+    assert isinstance(return_op, aziz.ReturnOp)
+    assert len(call.arguments) == len(block.args), f"arity mismatch in inlining {call} and {callee}"
+
+    Rewriter.inline_block(block, InsertPoint.before(call), call.arguments)
+    Rewriter.replace_op(call, [], [return_op.input] if return_op.input else [])
+    Rewriter.erase_op(return_op)
+    return calls
+
+
+def _size(func_op: aziz.FuncOp) -> int:
+    return sum(1 for _ in func_op.body.walk())
+
+
+def remove_dead_functions(module: ModuleOp) -> list[str]:
+    # removes the functions that aren't live (see `callgraph`), returns their names
+    graph = CallGraph(module)
+    live = graph.live()
+    dead = [name for name in graph.funcs if name not in live]
+    for name in dead:
+        Rewriter.erase_op(graph.funcs[name])
+    return dead
+
+
+class RemoveDeadFunctionsPass(ModulePass):
+    name = "remove-dead-functions"
 
-        while len(impl_block.args):
-            rewriter.erase_block_argument(impl_block.args[-1])
-
-        rewriter.inline_block(impl_block, InsertPoint.before(op))
-
-        return_op = op.prev_op
-        assert return_op is not None
-        assert isinstance(return_op, aziz.ReturnOp)
-        if return_op.input:
-            rewriter.replace_op(op, [], [return_op.input])
-        else:
-            rewriter.replace_op(op, [], [])
-        rewriter.erase_op(return_op)
-
-
-class RemoveUnusedPrivateFunctions(RewritePattern):
-    _used_funcs: set[str] | None = None
-
-    @op_type_rewrite_pattern
-    def match_and_rewrite(self, op: aziz.FuncOp, rewriter: PatternRewriter):
-        if self._is_unused(op):
-            rewriter.erase_op(op)
-
-    def _is_unused(self, op: aziz.FuncOp) -> bool:
-        if op.sym_visibility != StringAttr("private"):
-            return False
-
-        if self._used_funcs is None:
-            module = op.parent_op()
-            assert isinstance(module, ModuleOp)
-            self._used_funcs = {op.callee.string_value() for op in module.walk() if isinstance(op, aziz.CallOp)}
-
-        return op.sym_name.data not in self._used_funcs
+    def apply(self, _: Context, op: ModuleOp) -> None:
+        remove_dead_functions(op)
 
 
 class OptimizeAzizPass(ModulePass):
@@ -79,6 +125,7 @@ class OptimizeAzizPass(ModulePass):
 
     def apply(self, _: Context, op: ModuleOp) -> None:
         # no GreedyRewritePatternApplier here because we want to control the order
-        PatternRewriteWalker(InlineFunctions()).rewrite_module(op)
-        PatternRewriteWalker(RemoveUnusedPrivateFunctions()).rewrite_module(op)
+        EliminateTailCallsPass().apply(_, op)  # first, a function whose only recursion was a tail call can be inlined
+        inline_calls(op)  # also folds, see `canonicalize`
+        remove_dead_functions(op)
         dce(op)
@@ -0,0 +1,117 @@
+from dialects import aziz
+from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp, f64, i32
+from xdsl.ir import Attribute, Block, Operation, Region, SSAValue
+from xdsl.passes import ModulePass
+from xdsl.rewriter import InsertPoint, Rewriter
+
+# self tail calls into loops. a call of a function to itself is a tail call if its result is what the function returns,
+# directly or as the value of the `aziz.if` branches the function returns through. the body of such a function moves
+# into an `aziz.loop`, and every value the function can return becomes a tuple of the loop condition:
+#
+#   (defun fact (n acc)                      %r = aziz.loop(%n, %acc) ({
+#     (if (<= n 1)                           ^bb0(%n', %acc'):
+#         acc                     ─>            %c = aziz.le(%n', 1)
+#         (fact (- n 1) (* acc n))))            %again, %n'', %acc'', %v = aziz.if(%c)
+#                                                   then: yield 0, %n', %acc', %acc'        leave with acc
+#                                                   else: yield 1, n' - 1, acc' * n', 0    again with these
+#                                               aziz.loop_condition(%again) %n'', %acc'', %v
+#                                            })
+#                                            aziz.return %r
+#
+# the ifs on the way to a tail call yield the tuples, the other ifs are left alone. a call is only in tail position if
+# nothing runs between it and the terminator, so no side effect moves across an iteration.
+
+
+def eliminate_tail_calls(func_op: aziz.FuncOp) -> bool:
+    # rewrites `func_op` in place, returns whether it had self tail calls
+    name = func_op.sym_name.data
+    block = func_op.body.block
+    return_op = block.last_op
+    assert isinstance(return_op, aziz.ReturnOp)
+    if return_op.input is None or not _reaches_tail_call(return_op.input, return_op, name):
+        return False
+
+    # the body moves into the loop, the loop's arguments replace the function's
+    loop_block = Block(arg_types=block.arg_types)
+    for arg, loop_arg in zip(block.args, loop_block.args):
+        arg.replace_by(loop_arg)
+    for op in list(block.ops):
+        op.detach()
+        loop_block.add_op(op)
+
+    result_type = return_op.input.type
+    values, dead = _split(return_op.input, return_op, list(loop_block.args), result_type, name)
+    _replace_terminator(return_op, aziz.LoopConditionOp(values[0], values[1:]), dead)
+
+    loop = aziz.LoopOp(list(block.args), [result_type], Region(loop_block))
+    block.add_ops([loop, aziz.ReturnOp(loop.res[0])])
+    return True
+
+
+class EliminateTailCallsPass(ModulePass):
+    name = "eliminate-tail-calls"
+
+    def apply(self, _: Context, op: ModuleOp) -> None:
+        for func_op in [o for o in op.body.block.ops if isinstance(o, aziz.FuncOp)]:
+            eliminate_tail_calls(func_op)
+
+
+def _in_tail_position(value: SSAValue, terminator: Operation) -> bool:
+    # `value` is computed right before `terminator` and only used by it
+    return isinstance(value.owner, Operation) and value.owner.next_op is terminator and value.has_one_use()
+
+
+def _reaches_tail_call(value: SSAValue, terminator: Operation, name: str) -> bool:
+    if not _in_tail_position(value, terminator):
+        return False
+    match value.owner:
+        case aziz.CallOp() as call:
+            return call.callee.string_value() == name
+        case aziz.IfOp() as if_op if len(if_op.res) == 1:
+            branches = (if_op.then_region.block.last_op, if_op.else_region.block.last_op)
+            return any(_reaches_tail_call(y.inputs[0], y, name) for y in branches)
+    return False
+
+
+def _split(value: SSAValue, terminator: Operation, loop_args: list[SSAValue], result_type: Attribute, name: str) -> tuple[list[SSAValue], Operation | None]:
+    # (again, *next arguments, result) for a block that ends with `value`, computed before `terminator`, and the op to
+    # erase once the terminator is replaced
+    if not _reaches_tail_call(value, terminator, name):
+        again = aziz.ConstantOp(0)
+        Rewriter.insert_op(again, InsertPoint.before(terminator))
+        return [again.res, *loop_args, value], None
+
+    owner = value.owner
+    if isinstance(owner, aziz.CallOp):
+        again, placeholder = aziz.ConstantOp(1), _placeholder(result_type)
+        Rewriter.insert_op([again, placeholder], InsertPoint.before(terminator))
+        return [again.res, *owner.arguments, placeholder.res], owner
+
+    assert isinstance(owner, aziz.IfOp)
+    for region in (owner.then_region, owner.else_region):
+        yield_op = region.block.last_op
+        values, dead = _split(yield_op.inputs[0], yield_op, loop_args, result_type, name)
+        _replace_terminator(yield_op, aziz.YieldOp(*values), dead)
+
+    types = [i32, *(arg.type for arg in loop_args), result_type]
+    regions = [Rewriter.move_region_contents_to_new_regions(r) for r in (owner.then_region, owner.else_region)]
+    if_op = aziz.IfOp(owner.cond, types, regions)
+    Rewriter.insert_op(if_op, InsertPoint.before(owner))
+    return list(if_op.res), owner
+
+
+def _replace_terminator(terminator: Operation, new_terminator: Operation, dead: Operation | None) -> None:
+    Rewriter.insert_op(new_terminator, InsertPoint.before(terminator))
+    Rewriter.erase_op(terminator)
+    if dead is not None:
+        Rewriter.erase_op(dead)
+
+
+def _placeholder(type: Attribute) -> Operation:
+    # a value of `type` for the result slot of an iteration that doesn't leave the loop, never read
+    if type == f64:
+        return aziz.ConstantOp(0.0)
+    if isinstance(type, aziz.StringType):
+        return aziz.StringConstantOp("")
+    return aziz.ConstantOp(0)
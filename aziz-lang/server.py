@@ -0,0 +1,88 @@
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+from cache import ArtifactCache
+
+# persistent compile server: keeps xdsl, the loaded dialects and the emulator modules imported, so clients skip the cold start.
+#
+# protocol (one request per connection, newline-terminated json):
+#
+#   client -> {"file": "hello.aziz", "src": "(print 1)", "stages": ["riscv_asm", "emulator_output"], "parallel": false, "cache": null}
+#   server -> {"results": {"riscv_asm": "...", "emulator_output": "1\n"}}
+#          |  {"error": "traceback ..."}
+#
+# this module is imported by the thin client in `main.py`, so it must only depend on the standard library at import time.
+
+SOCKET_PATH = Path(os.environ.get("AZIZ_SOCKET", Path(tempfile.gettempdir()) / f"aziz-{os.getuid()}.sock"))
+
+
+class CompileServerError(Exception):
+    pass
+
+
+class _CompileHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from pipeline import Pipeline
+
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+            cache = ArtifactCache(**request["cache"]) if request.get("cache") else None
+            results = Pipeline(request["file"], request["src"], cache).run(request["stages"], parallel=request.get("parallel", False))
+            response = {"results": results}
+            if cache:
+                cache.evict()
+        except Exception:
+            response = {"error": traceback.format_exc()}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    # every request runs in a fork of the warm parent, so compilations can't leak state into each other
+    pass
+
+
+def serve(path: Path = SOCKET_PATH) -> None:
+    importlib.import_module("pipeline").preload()  # the pipeline imports backends lazily, the server wants them all up front
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # still clean up the socket file
+    path.unlink(missing_ok=True)
+    with CompileServer(str(path), _CompileHandler) as server:
+        print(f"aziz compile server listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            path.unlink(missing_ok=True)
+
+
+def compile_remote(file: str | Path, src: str, stages: list[str], parallel: bool = False, cache: ArtifactCache | None = None, path: Path = SOCKET_PATH) -> dict[str, str] | None:
+    # returns None if no server is listening, so the caller can fall back to compiling in-process
+    if not path.exists():
+        return None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None  # stale socket file
+
+        request = {"file": str(file), "src": src, "stages": stages, "parallel": parallel, "cache": cache and {"root": str(cache.root), "max_bytes": cache.max_bytes}}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            response = json.loads(f.readline())
+
+    if "error" in response:
+        raise CompileServerError(response["error"])
+    return response["results"]
+
@@ -0,0 +1,209 @@
+from pathlib import Path
+from typing import Iterator, TextIO
+
+from dialects import aziz
+from frontend.ast_nodes import CallExprAST, ExprAST, FunctionAST, PrototypeAST, VariableExprAST
+from frontend.ir_gen import IRGen, IRGenError, collect_call_signatures, declared_type
+from frontend.lexer import MappedSource, top_level_forms
+from frontend.parser import AzizParser
+from xdsl.dialects.builtin import FunctionType
+from xdsl.utils.exceptions import ParseError
+from xdsl.utils.lexer import Input, Span
+
+# streaming compilation: the source is never decoded, parsed or generated as a whole. each function is parsed, IR
+# generated, lowered and written out on its own, so memory is bound by the largest function instead of the program.
+#
+#   pass 1: parse form by form ─> argument types inferred from the calls, declared type of every function, call graph,
+#                                 undefined variables and functions and calls with the wrong number of arguments
+#   pass 2: parse form by form ─> defun: irgen ─> lower ─> write
+#                               └> top-level expression: collected into the next chunk of main
+#
+# the implicit main is assembled in chunks: every run of up to `MAIN_CHUNK_FORMS` top-level expressions becomes a private
+# function `main$<n>`, written once the functions it calls are generated (it has to see their final return types, like
+# main does when compiling the whole program). `main` itself calls the chunks in order and returns what the last
+# returns. what is kept across forms is one type per function. functions main doesn't reach are generated, so their
+# errors are reported, but not written.
+#
+# output is written as it's produced, so only the errors of pass 1 come before any of it. type errors are found by
+# irgen in pass 2 and end the output at the function they're in.
+#
+# functions are lowered like the incremental builds do it (see `incremental`), riscv without inlining.
+
+MAIN_CHUNK_FORMS = 256
+
+
+def stream(file: str | Path, backend: str, out: TextIO) -> None:
+    # writes the llvm dialect module ("llvm") or riscv assembly ("riscv") of `file` to `out`
+    file = Path(file)
+    writer = WRITERS[backend](out)
+    with MappedSource(file) as source:
+        def forms() -> Iterator[FunctionAST | ExprAST]:
+            # not a generator expression: its iterator argument would outlive a parse error in the traceback and keep
+            # the mapping from being closed
+            for start, end in top_level_forms(source.data):
+                yield _parse_form(file, source, start, end)
+
+        signatures: dict[str, list] = {}
+        protos: dict[str, PrototypeAST] = {}
+        graph: dict[str, set[str]] = {"main": set()}  # call graph, to leave out the functions main doesn't reach
+        arities: dict[str, set[int]] = {}  # argument counts the functions are called with
+        for form in forms():
+            if isinstance(form, FunctionAST):
+                protos[form.proto.name] = form.proto
+                collect_call_signatures(form.body, signatures)
+                graph[form.proto.name] = _check(form.body, form.proto.args, arities)
+            else:
+                collect_call_signatures((form,), signatures)
+                graph["main"] |= _check((form,), [], arities)
+        for name, counts in arities.items():
+            if name not in protos:
+                raise IRGenError(f"unknown function called: {name}")
+            if bad := counts - {len(protos[name].args)}:
+                raise IRGenError(f"function {name} expects {len(protos[name].args)} args but got {min(bad)}")
+        types: dict[str, FunctionType] = {name: declared_type(proto, signatures) for name, proto in protos.items()}  # final once generated
+        live = _reachable(graph)
+        del protos, graph, arities
+
+        generated: set[str] = set()
+        chunks: list[FunctionAST] = []  # of main, in order
+        waiting: list[FunctionAST] = []  # chunks whose callees aren't all generated yet
+        body: list[ExprAST] = []
+
+        def generate(func_ast: FunctionAST) -> None:
+            func_op = IRGen(types).ir_gen_function(func_ast, signatures)
+            types[func_ast.proto.name] = func_op.function_type
+            generated.add(func_ast.proto.name)
+            if func_ast.proto.name in live or func_ast.proto.name.startswith("main$"):  # dead ones are still checked
+                writer.function(func_op, types)
+
+        def close_chunk() -> None:
+            if body:
+                loc = body[0].loc
+                chunks.append(FunctionAST(loc, PrototypeAST(loc, f"main${len(chunks)}", []), tuple(body)))
+                waiting.append(chunks[-1])
+                body.clear()
+
+        def generate_ready() -> None:
+            for chunk in list(waiting):
+                if all(name in generated or name not in types for name in _callees(chunk.body)):  # unknown ones fail in irgen
+                    waiting.remove(chunk)
+                    generate(chunk)
+
+        for form in forms():
+            if isinstance(form, FunctionAST):
+                close_chunk()
+                generate(form)
+                generate_ready()
+            else:
+                body.append(form)
+                if len(body) == MAIN_CHUNK_FORMS:
+                    close_chunk()
+                    generate_ready()
+        close_chunk()
+        generate_ready()
+
+        if chunks:
+            loc = chunks[0].loc
+            generate(FunctionAST(loc, PrototypeAST(loc, "main", []), tuple(CallExprAST(loc, chunk.proto.name, []) for chunk in chunks)))
+    writer.finish()
+
+
+def stream_llvm_ir(file: str | Path, out: TextIO) -> None:
+    # llvm ir of `file` to `out`, the module is piped into the llvm tools as it's written
+    from llvm_exec import translate_llvm_streaming
+
+    out.flush()  # the tools write to the same file
+    translate_llvm_streaming(lambda pipe: stream(file, "llvm", pipe), out)
+
+
+def _parse_form(file: Path, source: MappedSource, start: int, end: int) -> FunctionAST | ExprAST:
+    # parse errors are moved to their position in the whole source
+    text = source.data[start:end].decode()
+    try:
+        module_ast = AzizParser(file, text).parse_module()
+    except ParseError as e:
+        offset = lambda i: start + len(text[:i].encode())
+        raise ParseError(Span(offset(e.span.start), offset(e.span.end), Input(source, str(file))), e.msg) from None
+    return module_ast.ops[0]
+
+
+def _walk(exprs: tuple[ExprAST, ...]) -> Iterator[ExprAST]:
+    stack = list(exprs)
+    while stack:
+        node = stack.pop()
+        yield node
+        stack += [getattr(node, field) for field in ("lhs", "rhs", "arg", "cond", "then_expr", "else_expr") if hasattr(node, field)]
+        stack += getattr(node, "args", ())
+
+
+def _callees(exprs: tuple[ExprAST, ...]) -> set[str]:
+    return {node.callee for node in _walk(exprs) if isinstance(node, CallExprAST)}
+
+
+def _check(exprs: tuple[ExprAST, ...], args: list[str], arities: dict[str, set[int]]) -> set[str]:
+    # what irgen rejects without knowing any types, before anything is written. returns the callees, argument counts
+    # of the calls go into `arities`
+    names = set()
+    for node in _walk(exprs):
+        if isinstance(node, VariableExprAST) and node.name not in args:
+            raise IRGenError(f"undefined var {node.name}")
+        if isinstance(node, CallExprAST):
+            names.add(node.callee)
+            arities.setdefault(node.callee, set()).add(len(node.args))
+    return names
+
+
+def _reachable(graph: dict[str, set[str]]) -> set[str]:
+    # functions reachable from main, see `CallGraph.live`
+    seen, stack = {"main"}, ["main"]
+    while stack:
+        for callee in graph[stack.pop()] - seen:
+            if callee in graph:  # unknown ones fail in irgen
+                seen.add(callee)
+                stack.append(callee)
+    return seen
+
+
+class LlvmWriter:
+    # the same module as `incremental.llvm_mlir`, with each function's globals right before it
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.printf: str | None = None
+        self.out.write("builtin.module {\n")
+
+    def function(self, func_op: aziz.FuncOp, types: dict[str, FunctionType]) -> None:
+        from incremental import lower_llvm_function
+
+        piece = lower_llvm_function(func_op, types)
+        self.printf = piece["symbols"].pop("printf", self.printf)
+        self._write([*piece["symbols"].values(), piece["body"]])
+
+    def finish(self) -> None:
+        self._write([self.printf] if self.printf else [])
+        self.out.write("}\n")
+
+    def _write(self, ops: list[str]) -> None:
+        self.out.write("".join(f"  {line}\n" for op in ops for line in op.splitlines()))
+
+
+class RiscvWriter:
+    # each function's data directives right before it, the print runtime at the end
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.runtime = ""
+
+    def function(self, func_op: aziz.FuncOp, types: dict[str, FunctionType]) -> None:
+        from incremental import declared_unit, lower_riscv_function
+        from rewrites.lower_riscv import format_assembly
+
+        piece = lower_riscv_function(func_op.sym_name.data, declared_unit(func_op, types))
+        self.runtime = self.runtime or piece["runtime"]
+        self.out.write(format_assembly(piece["data"] + piece["text"]))  # the text starts with `.text`
+
+    def finish(self) -> None:
+        from rewrites.lower_riscv import format_assembly
+
+        self.out.write(format_assembly(self.runtime))
+
+
+WRITERS = {"llvm": LlvmWriter, "riscv": RiscvWriter}
@@ -0,0 +1,56 @@
+from weakref import WeakKeyDictionary, WeakValueDictionary, ref
+
+from xdsl.dialects.builtin import ModuleOp, StringAttr
+from xdsl.ir import Block, Operation
+
+# name -> top-level symbol op of a module, instead of scanning the module block for every lookup.
+#
+# there is one index per module (`SymbolIndex.of`), shared by IRGen and the passes. code that adds symbols does so
+# through `add`. symbols erased or renamed behind the index's back are noticed on lookup (their op left the module), a
+# miss rebuilds the index once before it is believed. the index holds its module and symbols weakly, it lives as long as
+# the module does.
+
+
+class SymbolIndex:
+    def __init__(self, module: ModuleOp):
+        self._module = ref(module)
+        self.symbols: WeakValueDictionary[str, Operation] = WeakValueDictionary()
+        self.rebuild()
+
+    @staticmethod
+    def of(module: ModuleOp) -> "SymbolIndex":
+        if (index := _indexes.get(module)) is None:
+            index = _indexes[module] = SymbolIndex(module)
+        return index
+
+    @property
+    def block(self) -> Block:
+        return self._module().body.block
+
+    def rebuild(self) -> None:
+        self.symbols = WeakValueDictionary((name, op) for op in self.block.ops if (name := _sym_name(op)) is not None)
+
+    def lookup(self, name: str) -> Operation | None:
+        op = self.symbols.get(name)
+        if op is None or op.parent is not self.block or _sym_name(op) != name:
+            self.rebuild()
+            op = self.symbols.get(name)
+        return op
+
+    def add(self, op: Operation, at_start: bool = False) -> Operation:
+        # inserts `op` into the module, at the end or before all other ops
+        block = self.block
+        if at_start and block.first_op is not None:
+            block.insert_op_before(op, block.first_op)
+        else:
+            block.add_op(op)
+        self.symbols[_sym_name(op)] = op
+        return op
+
+
+_indexes: WeakKeyDictionary[ModuleOp, SymbolIndex] = WeakKeyDictionary()
+
+
+def _sym_name(op: Operation) -> str | None:
+    sym_name = op.properties.get("sym_name") or op.attributes.get("sym_name")
+    return sym_name.data if isinstance(sym_name, StringAttr) else None
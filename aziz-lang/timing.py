@@ -0,0 +1,174 @@
+import os
+import resource
+import subprocess
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from xdsl.dialects.builtin import ModuleOp
+
+# per-pass and per-tool instrumentation for `--timing` and `--memory`.
+# instrumented code calls `measure` / `measure_pass` / `run_tool` unconditionally, they only record while a `Recorder` is active.
+# memory accounting traces python allocations (tracemalloc), which slows everything down, so it is opt-in per recorder.
+
+
+@dataclass(slots=True)
+class Measurement:
+    name: str
+    seconds: float
+    ops_before: int | None = None
+    ops_after: int | None = None
+    funcs_touched: int | None = None
+    # with `Recorder.memory`
+    peak_bytes: int | None = None  # python heap high-water mark above the start of the step
+    rss_delta: int | None = None
+    input_bytes: int | None = None  # external tools: stdin or input files
+
+
+class Recorder:
+    def __init__(self, memory: bool = False):
+        self.measurements: list[Measurement] = []
+        self.memory = memory
+
+    @contextmanager
+    def active(self) -> Iterator["Recorder"]:
+        global _active
+        previous, _active = _active, self
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            _active = previous
+            if tracing:
+                tracemalloc.stop()
+
+    def report(self) -> str:
+        fmt = lambda v: "-" if v is None else str(v)
+        total = lambda ms, field: None if getattr(ms[0], field) is None else sum(getattr(m, field) for m in ms)
+        rows = [("name", "ms", "ops before", "ops after", "funcs touched")]
+        for label, ms in self._merged():
+            rows.append((label, f"{sum(m.seconds for m in ms) * 1e3:.2f}", *(fmt(total(ms, f)) for f in ("ops_before", "ops_after", "funcs_touched"))))
+        rows.append(("total", f"{sum(m.seconds for m in self.measurements) * 1e3:.2f}", "", "", ""))
+        return table(rows)
+
+    def memory_report(self) -> str:
+        # peaks of repeated steps are maxed, rss deltas and tool inputs summed up
+        kb = lambda v: "-" if v is None else f"{v / 1024:.1f}"
+        values = lambda ms, field: [getattr(m, field) for m in ms if getattr(m, field) is not None] or [None]
+        rows = [("name", "peak KB", "rss delta KB", "input KB")]
+        for label, ms in self._merged():
+            peak, rss, size = values(ms, "peak_bytes"), values(ms, "rss_delta"), values(ms, "input_bytes")
+            rows.append((label, kb(max(peak) if peak[0] is not None else None), kb(sum(rss) if rss[0] is not None else None), kb(sum(size) if size[0] is not None else None)))
+        peaks = [m.peak_bytes for m in self.measurements if m.peak_bytes is not None]
+        rows.append(("max", kb(max(peaks, default=None)), "", ""))
+        return table(rows)
+
+    def _merged(self) -> Iterator[tuple[str, list[Measurement]]]:
+        # repeated measurements (e.g. a pass applied to every function on its own) are merged into one row
+        merged: dict[str, list[Measurement]] = {}
+        for m in self.measurements:
+            merged.setdefault(m.name, []).append(m)
+        for name, ms in merged.items():
+            yield (name if len(ms) == 1 else f"{name} (x{len(ms)})"), ms
+
+
+_active: Recorder | None = None
+
+
+_peaks: list[int] = []  # heap peaks of the enclosing memory measurements, `tracemalloc.reset_peak` would lose them
+
+
+@contextmanager
+def measure(name: str, input_bytes: int | None = None) -> Iterator[None]:
+    if _active is None:
+        yield
+        return
+    m = Measurement(name, 0.0)
+    start = time.perf_counter()
+    try:
+        with _measure_memory(m) if _active.memory else nullcontext():
+            yield
+    finally:
+        m.seconds = time.perf_counter() - start
+        if _active.memory:
+            m.input_bytes = input_bytes
+        _active.measurements.append(m)
+
+
+@contextmanager
+def measure_pass(name: str, module_op: ModuleOp) -> Iterator[None]:
+    if _active is None:
+        yield
+        return
+
+    ops_before, funcs_before = _snapshot(module_op)
+    m = Measurement(name, 0.0, ops_before)
+    start = time.perf_counter()
+    try:
+        with _measure_memory(m) if _active.memory else nullcontext():
+            yield
+    finally:
+        m.seconds = time.perf_counter() - start
+        m.ops_after, funcs_after = _snapshot(module_op)
+
+        m.funcs_touched = sum(funcs_before.get(f) != funcs_after.get(f) for f in funcs_before.keys() | funcs_after.keys())
+        _active.measurements.append(m)
+
+
+def run_tool(args: list, name: str | None = None, **kwargs) -> subprocess.CompletedProcess:
+    # `subprocess.run` that is recorded under the tool's name, its input is what's piped in or the files it's given
+    input_bytes = None
+    if _active is not None and _active.memory:
+        stdin = kwargs.get("input")
+        input_bytes = len(stdin.encode() if isinstance(stdin, str) else stdin) if stdin is not None else sum(Path(a).stat().st_size for a in args[1:] if isinstance(a, Path) and Path(a).is_file())
+    with measure(name or Path(args[0]).name, input_bytes):
+        return subprocess.run(args, **kwargs)
+
+
+@contextmanager
+def _measure_memory(m: Measurement) -> Iterator[None]:
+    current, peak = tracemalloc.get_traced_memory()
+    if _peaks:
+        _peaks[-1] = max(_peaks[-1], peak)
+    tracemalloc.reset_peak()
+    rss = _rss()
+    _peaks.append(0)
+    try:
+        yield
+    finally:
+        peak = max(tracemalloc.get_traced_memory()[1], _peaks.pop())
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], peak)
+        m.peak_bytes, m.rss_delta = peak - current, _rss() - rss
+
+
+def _rss() -> int:
+    # resident set size in bytes. outside of linux only the peak is available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _snapshot(module_op: ModuleOp) -> tuple[int, dict[str, tuple]]:
+    # (op count, function name -> names and result types of all nested ops). a pass "touches" a function if the latter changes.
+    op_count, functions = 0, {}
+    for op in module_op.body.block.ops:
+        names = tuple((o.name, *o.result_types) for o in op.walk())
+        op_count += len(names)
+        sym_name = op.attributes.get("sym_name") or op.properties.get("sym_name")
+        if op.regions and sym_name is not None:
+            functions[sym_name.data] = names
+    return op_count, functions
+
+
+def table(rows: list[tuple[str, ...]]) -> str:
+    # first column left-aligned, the rest right-aligned
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(row[0].ljust(widths[0]) + "".join(f"  {cell.rjust(w)}" for cell, w in zip(row[1:], widths[1:])) for row in rows)
@@ -0,0 +1,63 @@
+import argparse
+import random
+
+# generators for benchmark programs too large to check in. deterministic for a given size and seed.
+#
+#   python benchmarks/generate.py many-functions 1000 > many.aziz
+
+
+def many_functions(n: int, seed: int = 0) -> str:
+    # `n` small independent functions with mixed int / float signatures, each called from main once
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        if rng.random() < 0.5:
+            lines.append(f"(defun f{i} (a b)\n  (+ (* a {rng.randint(1, 9)}) (- b {rng.randint(1, 9)})))")
+            lines.append(f"(print (f{i} {rng.randint(-99, 99)} {rng.randint(-99, 99)}))")
+        else:
+            lines.append(f"(defun f{i} (x)\n  (if (<= x 0)\n      (* x {rng.randint(2, 9)})\n      (+ x {rng.randint(1, 99)})))")
+            lines.append(f"(print (f{i} {rng.randint(-99, 99)}))")
+    return "\n".join(lines) + "\n"
+
+
+def large_source(n: int, seed: int = 0) -> str:
+    # `n` top-level statements: nested arithmetic, string output and comments, few functions
+    rng = random.Random(seed)
+
+    def expr(depth: int) -> str:
+        if depth == 0 or rng.random() < 0.3:
+            return str(rng.randint(0, 99))
+        return f"({rng.choice('+-*')} {expr(depth - 1)} {expr(depth - 1)})"
+
+    lines = ["(defun twice (x)\n  (+ x x))", "(defun label () \"checkpoint\")"]
+    for i in range(n):
+        match i % 4:
+            case 0:
+                lines.append(f"; statement {i}")
+                lines.append(f"(print {expr(4)})")
+            case 1:
+                lines.append(f"(print (twice {expr(3)}))")
+            case 2:
+                lines.append(f'(print "line {i} of a large generated source file")')
+            case 3:
+                lines.append("(print (label))")
+    return "\n".join(lines) + "\n"
+
+
+GENERATORS = {
+    "many-functions": many_functions,
+    "large-source": large_source,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate large aziz benchmark programs")
+    parser.add_argument("kind", choices=list(GENERATORS))
+    parser.add_argument("size", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(GENERATORS[args.kind](args.size, args.seed), end="")
+
+
+if __name__ == "__main__":
+    main()
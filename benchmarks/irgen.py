@@ -0,0 +1,50 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from generate import many_functions
+
+# IRGen benchmark on modules of many functions: the pass that finds the functions and infers their signatures from the
+# calls, and the whole of IRGen (declarations, bodies and verification).
+#
+#   python benchmarks/irgen.py [--runs N] [--functions 10000 20000]
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "aziz-lang"))
+
+
+def main():
+    from frontend.ir_gen import IRGen
+    from frontend.parser import AzizParser
+
+    parser = argparse.ArgumentParser(description="aziz IRGen benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="runs per configuration")
+    parser.add_argument("--functions", type=int, nargs="+", default=[10_000, 20_000], help="module sizes in functions")
+    args = parser.parse_args()
+
+    configurations = {
+        "signatures": lambda module_ast: IRGen()._collect_functions(module_ast),
+        "irgen": lambda module_ast: IRGen().ir_gen_module(module_ast),
+    }
+
+    rows = [("functions", "stage", "median ms", "min ms", "max ms", "us / function")]
+    for n in args.functions:
+        module_ast = AzizParser(Path("bench.aziz"), many_functions(n)).parse_module()
+        for label, run in configurations.items():
+            samples = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                run(module_ast)
+                samples.append(time.perf_counter() - start)
+            median = statistics.median(samples)
+            rows.append((str(n), label, f"{median * 1e3:.1f}", f"{min(samples) * 1e3:.1f}", f"{max(samples) * 1e3:.1f}", f"{median / n * 1e6:.1f}"))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print(row[0].ljust(widths[0]) + "".join(f"  {cell.rjust(w)}" for cell, w in zip(row[1:], widths[1:])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from generate import large_source, many_functions
+
+# lexer micro-benchmark: tokenizing multi-megabyte generated sources into the token buffer (from the decoded text and
+# from an mmap of the file), handing the tokens out through `AzizLexer.lex` (what the parser pulls) and parsing, in MB/s.
+#
+#   python benchmarks/lexer.py [--runs N] [--mb 1 4]
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "aziz-lang"))
+
+
+def source(generate, mb: float) -> str:
+    # smallest generated program of at least `mb` megabytes
+    n = 1000
+    while len(src := generate(n)) < mb * 2**20:
+        n *= 2
+    return src
+
+
+def main():
+    from frontend.lexer import AzizLexer, MappedSource, tokenize
+    from frontend.parser import AzizParser
+    from xdsl.utils.lexer import Input
+
+    parser = argparse.ArgumentParser(description="aziz lexer micro-benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="runs per configuration")
+    parser.add_argument("--mb", type=float, nargs="+", default=[1, 4], help="source sizes in megabytes")
+    args = parser.parse_args()
+
+    def lex_all(path: Path):
+        lexer = AzizLexer(Input(path.read_text(), "bench.aziz"))
+        for _ in range(len(lexer.tokens)):
+            lexer.lex()
+
+    def tokenize_mapped(path: Path):
+        with MappedSource(path) as source:
+            tokenize(Input(source, "bench.aziz"))
+
+    # each includes reading the file
+    configurations = {
+        "tokenize": lambda path: tokenize(Input(path.read_text(), "bench.aziz")),
+        "tokenize mmap": tokenize_mapped,
+        "lex": lex_all,
+        "parse": lambda path: AzizParser(path, path.read_text()).parse_module(),
+    }
+
+    rows = [("source", "MB", "tokens", "stage", "median MB/s", "min ms", "max ms")]
+    for mb in args.mb:
+        for generate in (large_source, many_functions):
+            src = source(generate, mb)
+            size, tokens = len(src) / 2**20, len(tokenize(Input(src, "bench.aziz")))
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "bench.aziz"
+                path.write_text(src)
+                for label, run in configurations.items():
+                    samples = []
+                    for _ in range(args.runs):
+                        start = time.perf_counter()
+                        run(path)
+                        samples.append(time.perf_counter() - start)
+                    rows.append((generate.__name__, f"{size:.1f}", str(tokens), label, f"{size / statistics.median(samples):.1f}", f"{min(samples) * 1e3:.1f}", f"{max(samples) * 1e3:.1f}"))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print(row[0].ljust(widths[0]) + "".join(f"  {cell.rjust(w)}" for cell, w in zip(row[1:], widths[1:])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from generate import large_source, many_functions
+
+# benchmark runner: times every pipeline stage and each backend's execution over the corpus and reports medians and
+# spread. every run compiles from scratch in a fresh `Pipeline`, without artifact cache.
+#
+#   python benchmarks/run.py [--runs 5] [--backend riscv] [files...]
+
+ROOT = Path(__file__).resolve().parent.parent
+CORPUS = Path(__file__).resolve().parent / "corpus"
+sys.path.insert(0, str(ROOT / "aziz-lang"))
+
+FRONTEND = ("module_ast", "module_op")
+
+# backend -> stages in dependency order, the last one executes the program
+BACKENDS: dict[str, tuple[str, ...]] = {
+    "interpreter": ("interpreter_output",),
+    "llvm": ("llvm_mlir", "llvm_ir", "llvm_obj", "llvm_exe", "llvm_output"),
+    "riscv": ("riscv_asm", "riscv_elf", "emulator_output"),
+}
+
+# generated programs, name -> (generator, size)
+GENERATED = {
+    "many_functions.aziz": (many_functions, 500),
+    "large_source.aziz": (large_source, 2000),
+}
+
+
+def bench_file(file: Path, backends: list[str], runs: int) -> tuple[dict[str, list[float]], dict[str, str]]:
+    # stage -> seconds per run, backend -> error of its first failing stage
+    from pipeline import Pipeline
+
+    samples: dict[str, list[float]] = {}
+    errors: dict[str, str] = {}
+    for _ in range(runs):
+        pipeline = Pipeline(file)
+        for stage in FRONTEND:
+            samples.setdefault(stage, []).append(timed(pipeline, stage))
+        for backend in backends:
+            if backend in errors:
+                continue
+            try:
+                for stage in BACKENDS[backend]:
+                    seconds = timed(pipeline, stage)
+                    samples.setdefault(stage, []).append(seconds)
+            except Exception as e:
+                errors[backend] = f"{type(e).__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ''}"
+    return samples, errors
+
+
+def timed(pipeline, stage: str) -> float:
+    # stages are cached properties, so this only measures `stage` itself: its dependencies were built before
+    start = time.perf_counter()
+    getattr(pipeline, stage)
+    return time.perf_counter() - start
+
+
+def report(results: list[tuple[Path, dict[str, list[float]], dict[str, str]]]) -> str:
+    rows = [("file", "stage", "median ms", "stdev ms", "cv %", "min ms", "max ms")]
+    failures = []
+    for file, samples, errors in results:
+        for stage, xs in samples.items():
+            median, stdev = statistics.median(xs), statistics.stdev(xs) if len(xs) > 1 else 0.0
+            cv = f"{stdev / statistics.mean(xs) * 100:.1f}" if statistics.mean(xs) > 0 else "-"
+            rows.append((file.name, stage, f"{median * 1e3:.2f}", f"{stdev * 1e3:.2f}", cv, f"{min(xs) * 1e3:.2f}", f"{max(xs) * 1e3:.2f}"))
+        for backend, error in errors.items():
+            failures.append(f"{file.name}: {backend} failed: {error}")
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = [f"{row[0].ljust(widths[0])}  {row[1].ljust(widths[1])}" + "".join(f"  {cell.rjust(w)}" for cell, w in zip(row[2:], widths[2:])) for row in rows]
+    return "\n".join(lines + failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="aziz benchmark runner")
+    parser.add_argument("files", nargs="*", type=Path, help="source files (default: the corpus and the generated programs)")
+    parser.add_argument("--runs", type=int, default=5, help="runs per file")
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS), help="backends to run (default: all)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = args.files
+        if not files:
+            files = sorted(CORPUS.glob("*.aziz"))
+            for name, (generate, size) in GENERATED.items():
+                (Path(tmp) / name).write_text(generate(size))
+                files.append(Path(tmp) / name)
+
+        # the interpreter recurses in python once per aziz call, deep recursion needs a big stack
+        sys.setrecursionlimit(1_000_000)
+        threading.stack_size(1 << 30)
+        results = []
+        worker = threading.Thread(target=lambda: results.extend((f, *bench_file(f, args.backend or list(BACKENDS), args.runs)) for f in files))
+        worker.start()
+        worker.join()
+
+    print(report(results))
+
+
+if __name__ == "__main__":
+    main()
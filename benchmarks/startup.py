@@ -0,0 +1,53 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# cold start benchmark: lazy imports (the default) vs everything imported up front via `pipeline.preload()`.
+#
+#   python benchmarks/startup.py [--runs N] [file.aziz]
+
+ROOT = Path(__file__).resolve().parent.parent
+COMPILER = ROOT / "aziz-lang"
+
+# label -> python snippet, each run in a fresh interpreter
+SNIPPETS: dict[str, str] = {
+    "import (lazy)": "import pipeline",
+    "import (eager)": "import pipeline; pipeline.preload()",
+    "interpret (lazy)": "from pipeline import Pipeline; Pipeline({file!r}).interpreter_output",
+    "interpret (eager)": "import pipeline; pipeline.preload(); pipeline.Pipeline({file!r}).interpreter_output",
+    "riscv asm (lazy)": "from pipeline import Pipeline; Pipeline({file!r}).riscv_asm",
+    "riscv asm (eager)": "import pipeline; pipeline.preload(); pipeline.Pipeline({file!r}).riscv_asm",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="aziz compiler startup benchmark")
+    parser.add_argument("file", nargs="?", type=Path, default=ROOT / "examples" / "rec.aziz", help="source file to compile")
+    parser.add_argument("--runs", type=int, default=10, help="runs per configuration")
+    args = parser.parse_args()
+
+    rows = [("configuration", "median ms", "min ms", "max ms")]
+    for label, snippet in SNIPPETS.items():
+        samples = [time_run([sys.executable, "-c", snippet.format(file=str(args.file.resolve()))]) for _ in range(args.runs)]
+        rows.append((label, *(f"{f(samples) * 1e3:.1f}" for f in (statistics.median, min, max))))
+
+    cli = [sys.executable, COMPILER / "main.py", args.file, "--interpret", "--no-server"]
+    samples = [time_run(cli) for _ in range(args.runs)]
+    rows.append(("main.py --interpret", *(f"{f(samples) * 1e3:.1f}" for f in (statistics.median, min, max))))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print(row[0].ljust(widths[0]) + "".join(f"  {cell.rjust(w)}" for cell, w in zip(row[1:], widths[1:])))
+
+
+def time_run(args: list) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, cwd=COMPILER, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()